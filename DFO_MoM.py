@@ -5,31 +5,19 @@ DFO_MoM.py
     -- Write the output Final_Attributes_yyyymmddhhMOM+DFOUpdated.csv and Attributes_clean_yyyymmddhhMOM+DFOUpdated.csv file.
 """
 
-import csv
 import logging
 import os
 import sys
 
-import numpy as np
-import pandas as pd
-import scipy.stats
-
+import catalog
+import reference_data
+import scoring
 import settings
-from HWRF_MoM import hwrf_workflow
+import watershed_store
+from HWRF_MoM import MOM_DROP_COLUMNS, hwrf_workflow
 from utilities import read_data
 
 
-def mofunc_dfo(row):
-    if row["Severity"] > 0.8 or row["Hazard_Score"] > 80:
-        return "Warning"
-    elif 0.6 < row["Severity"] < 0.80 or 60 < row["Hazard_Score"] < 80:
-        return "Watch"
-    elif 0.35 < row["Severity"] < 0.6 or 35 < row["Hazard_Score"] < 60:
-        return "Advisory"
-    elif 0 < row["Severity"] < 0.35 or 0 < row["Hazard_Score"] < 35:
-        return "Information"
-
-
 def update_DFO_MoM(adate):
     """update MoM - DFO at a given date"""
 
@@ -71,229 +59,28 @@ def update_DFO_MoM(adate):
         settings.HWRF_MOM_DIR, "Final_Attributes_{}{}HWRFUpdated.csv".format(adate, hh)
     )
 
-    weightage = read_data(os.path.join(settings.BASE_DATA_DIR, "DFO_Weightage.csv"))
-    Attributes = read_data(os.path.join(settings.BASE_DATA_DIR, "Attributes.csv"))
-    PDC_resilience = read_data(
-        os.path.join(settings.BASE_DATA_DIR, "Resilience_Index.csv")
-    )
-
-    add_field_DFO = [
-        "DFO_area_1day_score",
-        "DFO_percarea_1day_score",
-        "DFO_area_2day_score",
-        "DFO_percarea_2day_score",
-        "DFO_area_3day_score",
-        "DFO_percarea_3day_score",
-        "DFOTotal_Score",
-    ]
-
-    with open(DFOsummary, "r", encoding="UTF-8") as DFO_file:
-        DFO_reader = csv.reader(DFO_file)
-        DFO_w_score_csv = "DFO_w_score_{}.csv".format(adate)
-        DFO_w_score_csv = os.path.join(settings.DFO_PROC_DIR, DFO_w_score_csv)
-        csvfile = open(DFO_w_score_csv, "w", newline="\n", encoding="utf-8")
-        DFO_w_score = csv.writer(csvfile)
-        row_count = 1
-        # csv_writer = csv.writer(write_obj)
-        for row in DFO_reader:
-            if row_count == 1:
-                for x in add_field_DFO:
-                    row.append(x)
-                row_count = row_count + 1
-            else:
-                if float(row[4]) / float(weightage.DFO_Area_wt[0]) > float(
-                    weightage.DFO_Area_max_pt[0]
-                ):
-                    DFO_area_1day_score = str(
-                        float(weightage.DFO_Area_max_pt[0])
-                        * float(weightage.one_Day_Multiplier[0])
-                    )
-                else:
-                    DFO_area_1day_score = str(
-                        float(weightage.DFO_Area_Min_pt[0])
-                        * float(weightage.one_Day_Multiplier[0])
-                        * float(row[4])
-                        / float(weightage.DFO_Area_wt[0])
-                    )
-                if float(row[5]) / float(weightage.DFO_percArea_wt[0]) > float(
-                    weightage.DFO_percArea_Maxpt[0]
-                ):
-                    DFO_perc_area_1day_score = str(
-                        float(weightage.DFO_percArea_Maxpt[0])
-                        * float(weightage.one_Day_Multiplier[0])
-                    )
-                else:
-                    DFO_perc_area_1day_score = str(
-                        float(weightage.DFO_percArea_Minpt[0])
-                        * float(weightage.one_Day_Multiplier[0])
-                        * float(row[5])
-                        / float(weightage.DFO_percArea_wt[0])
-                    )
-                if float(row[6]) / float(weightage.DFO_Area_wt[0]) > float(
-                    weightage.DFO_Area_max_pt[0]
-                ):
-                    DFO_area_2day_score = str(
-                        float(weightage.DFO_Area_max_pt[0])
-                        * float(weightage.two_Day_Multiplier[0])
-                    )
-                else:
-                    DFO_area_2day_score = str(
-                        float(weightage.DFO_Area_Min_pt[0])
-                        * float(weightage.two_Day_Multiplier[0])
-                        * float(row[6])
-                        / float(weightage.DFO_Area_wt[0])
-                    )
-                if float(row[7]) / float(weightage.DFO_percArea_wt[0]) > float(
-                    weightage.DFO_percArea_Maxpt[0]
-                ):
-                    DFO_perc_area_2day_score = str(
-                        float(weightage.DFO_percArea_Maxpt[0])
-                        * float(weightage.two_Day_Multiplier[0])
-                    )
-                else:
-                    DFO_perc_area_2day_score = str(
-                        float(weightage.DFO_percArea_Minpt[0])
-                        * float(weightage.two_Day_Multiplier[0])
-                        * float(row[7])
-                        / float(weightage.DFO_percArea_wt[0])
-                    )
-                if float(row[8]) / float(weightage.DFO_Area_wt[0]) > float(
-                    weightage.DFO_Area_max_pt[0]
-                ):
-                    DFO_area_3day_score = str(
-                        float(weightage.DFO_Area_max_pt[0])
-                        * float(weightage.three_Day_Multiplier[0])
-                    )
-                else:
-                    DFO_area_3day_score = str(
-                        float(weightage.DFO_Area_Min_pt[0])
-                        * float(weightage.three_Day_Multiplier[0])
-                        * float(row[8])
-                        / float(weightage.DFO_Area_wt[0])
-                    )
-                if float(row[9]) / float(weightage.DFO_percArea_wt[0]) > float(
-                    weightage.DFO_percArea_Maxpt[0]
-                ):
-                    DFO_perc_area_3day_score = str(
-                        float(weightage.DFO_percArea_Maxpt[0])
-                        * float(weightage.three_Day_Multiplier[0])
-                    )
-                else:
-                    DFO_perc_area_3day_score = str(
-                        float(weightage.DFO_percArea_Minpt[0])
-                        * float(weightage.three_Day_Multiplier[0])
-                        * float(row[9])
-                        / float(weightage.DFO_percArea_wt[0])
-                    )
-
-                Sum_Score = str(
-                    (
-                        float(DFO_area_1day_score)
-                        + float(DFO_perc_area_1day_score)
-                        + float(DFO_area_2day_score)
-                        + float(DFO_perc_area_2day_score)
-                        + float(DFO_area_3day_score)
-                        + float(DFO_perc_area_3day_score)
-                    )
-                )
-                score_field = [
-                    DFO_area_1day_score,
-                    DFO_perc_area_1day_score,
-                    DFO_area_2day_score,
-                    DFO_perc_area_2day_score,
-                    DFO_area_3day_score,
-                    DFO_perc_area_3day_score,
-                    Sum_Score,
-                ]
-                for x in score_field:
-                    row.append(x)
-            DFO_w_score.writerow(row)
-    csvfile.close()
-
-    DFO = read_data(DFO_w_score_csv)
+    DFO = scoring.score_file(DFOsummary, "DFO")
     DFO = DFO[DFO.DFOTotal_Score > 0.1]
     DFO = DFO.iloc[:, 1:]
     MOM = read_data(MOMOutput)
-    MOM.drop(
-        columns=[
-            "area_km2",
-            "ISO",
-            "Admin0",
-            "Admin1",
-            "rfr_score",
-            "cfr_score",
-            "Resilience_Index",
-            " NormalizedLackofResilience ",
-            "Severity",
-            "Alert",
-        ],
-        inplace=True,
-    )
-    Final_Output_0 = pd.merge(
-        MOM.set_index("pfaf_id"), DFO.set_index("pfaf_id"), on="pfaf_id", how="outer"
-    )
-    join1 = pd.merge(
-        Attributes,
-        PDC_resilience[["ISO", "Resilience_Index", " NormalizedLackofResilience "]],
-        on="ISO",
-        how="inner",
-    )
-    Final_Output = pd.merge(
-        join1.set_index("pfaf_id"), Final_Output_0, on="pfaf_id", how="outer"
+    MOM.drop(columns=MOM_DROP_COLUMNS, inplace=True)
+    Final_Output_0 = watershed_store.join(
+        [MOM.set_index("pfaf_id"), DFO.set_index("pfaf_id")]
     )
+    join1 = reference_data.watershed_attributes()
+    Final_Output = watershed_store.join([join1.set_index("pfaf_id"), Final_Output_0])
     Final_Output[["Hazard_Score"]] = Final_Output[["Hazard_Score"]].fillna(value=0)
-    Final_Output.loc[
-        (Final_Output["Hazard_Score"] < Final_Output["DFOTotal_Score"]), "Flag"
-    ] = 2
-    Final_Output["Hazard_Score"] = Final_Output[["Hazard_Score", "DFOTotal_Score"]].max(
-        axis=1
-    )
-    Final_Output = Final_Output[Final_Output.Hazard_Score != 0]
-    Final_Output.drop(
-        Final_Output.index[
-            (Final_Output["rfr_score"] == 0) & (Final_Output["cfr_score"] == 0)
-        ],
-        inplace=True,
-    )
-    Final_Output = Final_Output.assign(
-        Scaled_Riverine_Risk=lambda x: Final_Output["rfr_score"] * 20
-    )
-    Final_Output = Final_Output.assign(
-        Scaled_Coastal_Risk=lambda x: Final_Output["cfr_score"] * 20
-    )
-    Final_Output = Final_Output.assign(
-        Severity=lambda x: scipy.stats.norm(
-            np.log(
-                100
-                - Final_Output[["Scaled_Riverine_Risk", "Scaled_Coastal_Risk"]].max(
-                    axis=1
-                )
-            ),
-            1,
-        ).cdf(np.log(Final_Output["Hazard_Score"]))
-    )
-    Final_Output["Alert"] = Final_Output.apply(mofunc_dfo, axis=1)
-    Final_Output.loc[Final_Output["Alert"] == "Information", "Flag"] = ""
-    Final_Output.loc[Final_Output["Alert"] == "Advisory", "Flag"] = ""
+    Final_Output = scoring.fuse_hazard(Final_Output, "DFOTotal_Score", 2)
     Final_Output.to_csv(Final_Attributes_csv, encoding="utf-8-sig")
+    catalog.register(Final_Attributes_csv)
     # Final_Output.to_csv('Final_Attributes_20210701_DFOUpdated.csv', encoding='utf-8-sig')
-    join1 = pd.merge(
-        Attributes,
-        PDC_resilience[["ISO", "Resilience_Index", " NormalizedLackofResilience "]],
-        on="ISO",
-        how="inner",
-    )
-    Attributes_Clean_DFO_Updated = pd.merge(
-        join1.set_index("pfaf_id"),
-        Final_Output[["Alert", "Flag"]],
-        on="pfaf_id",
-        how="right",
+    Attributes_Clean_DFO_Updated = watershed_store.join(
+        [join1.set_index("pfaf_id"), Final_Output[["Alert", "Flag"]]], how="right"
     )
     Attributes_Clean_DFO_Updated.to_csv(Attributes_Clean_csv, encoding="utf-8-sig")
+    catalog.register(Attributes_Clean_csv)
     logging.info("generated: " + Final_Attributes_csv)
 
-    os.remove(DFO_w_score_csv)
-
     return
 
 
@@ -9,24 +9,28 @@ Two main function:
 """
 
 import csv
+import filecmp
 import json
 import logging
 import os
 import shutil
 import subprocess
 import sys
+import time
 from datetime import date, datetime, timezone
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 
 import geopandas
 import numpy as np
 import pandas as pd
 import rasterio
 import requests
-from bs4 import BeautifulSoup
 from rasterio.mask import mask
 from osgeo import gdal
 
+import catalog
+import listing_cache
 from DFO_MoM import update_DFO_MoM
 import settings
 from utilities import from_today, watersheds_gdb_reader
@@ -38,6 +42,14 @@ from utilities import from_today, watersheds_gdb_reader
 DFO_TOTAL_TILES = 287
 DFO_MINIMUM_TILES = 280
 
+# flood layers and their HDF4 subdatasets
+DFO_FLOOD_LAYERS = {
+    "Flood 1-Day 250m": "Flood_1Day_250m",
+    "Flood 1-Day CS 250m": "FloodCS_1Day_250m",
+    "Flood 2-Day 250m": "Flood_2Day_250m",
+    "Flood 3-Day 250m": "Flood_3Day_250m",
+}
+
 
 def get_real_date(year, day_num):
     """get the real date"""
@@ -53,10 +65,7 @@ def get_real_date(year, day_num):
 def check_status(adate):
     """check if a give date is processed"""
 
-    processed_list = os.listdir(settings.DFO_SUM_DIR)
-    processed = any(adate in x for x in processed_list)
-
-    return processed
+    return catalog.exists("DFO", "summary", adate)
 
 
 def get_hosturl():
@@ -74,14 +83,16 @@ def generate_procesing_list():
     {'001': '20230101', '002': '20230102'}
     """
     hosturl = get_hosturl()
-    reqs = requests.get(hosturl)
-    soup = BeautifulSoup(reqs.text, "html.parser")
+    try:
+        [links, _] = listing_cache.listing(hosturl)
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Error accessing host URL {hosturl}: {e}")
+        return {}
     cur_year = hosturl[-4:]
     datelist = {}
     # get the today in str
     today_str = datetime.now(timezone.utc).strftime("%Y%m%d")
-    for link in soup.find_all("a"):
-        day_num = link.string
+    for day_num in links:
         if not day_num.isdigit():
             continue
         real_date = get_real_date(cur_year, day_num)
@@ -143,20 +154,18 @@ def dfo_download(subfolder):
     return
 
 
-def dfo_extract_by_mask(vrt_file, mask_json):
-    """extract data for a single watershed"""
+def dfo_extract_by_mask(src, mask_json):
+    """extract data for a single watershed, src: the flood layer as an open dataset"""
 
-    with rasterio.open(vrt_file) as src:
-        try:
-            out_image, out_transform = mask(
-                src, [mask_json["features"][0]["geometry"]], crop=True
-            )
-        except ValueError as e:
-            #'Input shapes do not overlap raster.'
-            # print(e)
-            src = None
-            # return empty dataframe
-            return 0
+    try:
+        out_image, out_transform = mask(
+            src, [mask_json["features"][0]["geometry"]], crop=True
+        )
+    except ValueError as e:
+        #'Input shapes do not overlap raster.'
+        # print(e)
+        # return empty dataframe
+        return 0
 
     # extract data
     no_data = src.nodata
@@ -164,7 +173,6 @@ def dfo_extract_by_mask(vrt_file, mask_json):
     # print(out_image)
     data = out_image[0]
     point_count = np.count_nonzero(data == 3)
-    src = None
 
     # total area
     d = point_count * 0.25 * 0.25
@@ -179,7 +187,7 @@ def dfo_extract_by_watershed(vtk_file):
     pfaf_id_list = watersheds.index.tolist()
 
     headerprefix = os.path.basename(vtk_file).split("_")[1]
-    if "_CS_" in vtk_file:
+    if "_CS_" in os.path.basename(vtk_file):
         headerprefix = "1-Day_CS"
 
     headers_list = [
@@ -187,7 +195,7 @@ def dfo_extract_by_watershed(vtk_file):
         headerprefix + "_TotalArea_km2",
         headerprefix + "_perc_Area",
     ]
-    summary_file = os.path.basename(vtk_file)[:-4] + ".csv"
+    summary_file = vtk_file[:-4] + ".csv"
     if not os.path.exists(summary_file):
         with open(summary_file, "w") as f:
             writer = csv.writer(f)
@@ -197,7 +205,8 @@ def dfo_extract_by_watershed(vtk_file):
         return
 
     # count = 0
-    with open(summary_file, "a") as f:
+    # the layer is opened once, the decoded blocks stay in the GDAL cache
+    with open(summary_file, "a") as f, rasterio.open(vtk_file) as src:
         writer = csv.writer(f)
 
         for pfaf_id in pfaf_id_list:
@@ -209,7 +218,7 @@ def dfo_extract_by_watershed(vtk_file):
                 geopandas.GeoSeries([watersheds.loc[pfaf_id, "geometry"]]).to_json()
             )
             # plot check
-            dfoarea = dfo_extract_by_mask(vtk_file, test_json)
+            dfoarea = dfo_extract_by_mask(src, test_json)
 
             DFO_TotalArea = dfoarea
             DFO_Area_percent = DFO_TotalArea / watersheds.loc[pfaf_id]["area_km2"] * 100
@@ -224,15 +233,146 @@ def dfo_extract_by_watershed(vtk_file):
     return
 
 
+def dfo_process_layer(
+    hdffolder, hdffiles, flood, subdataset, adate, outfolder=None, img_dir=None
+):
+    """process a flood layer of the hdf files, run in a worker process
+    -- the vrt is built over the HDF4 subdatasets, they are decoded in
+       process by the zonal stats, no tiff is written per tile
+    -- the 3-Day layer is written as the DFO image product
+    -- outfolder: folder of the vrt and the summary, default hdffolder
+    -- img_dir: folder of the image product, default DFO_IMG_DIR
+    return the summary csv of the layer
+    """
+
+    outfolder = hdffolder if outfolder is None else outfolder
+    img_dir = settings.DFO_IMG_DIR if img_dir is None else img_dir
+    # every tile of the vrt stays open: with the default pool of 100
+    # datasets, the HDF4 files would be closed and reopened by the zonal stats
+    pool_size = str(max(len(hdffiles), DFO_TOTAL_TILES))
+    gdal.SetConfigOption("GDAL_MAX_DATASET_POOL_SIZE", pool_size)
+
+    subfolder = flood.replace(" ", "_")
+    # HDF4_EOS:EOS_GRID:"{HDF}":Grid_Water_Composite:{subdataset}
+    inputlayers = [
+        f'HDF4_EOS:EOS_GRID:"{os.path.join(hdffolder, HDF)}":Grid_Water_Composite:{subdataset}'
+        for HDF in hdffiles
+    ]
+    vrt = os.path.join(outfolder, f"{subfolder}.vrt")
+    gdal.BuildVRT(vrt, inputlayers)
+    # extract flood data
+    with rasterio.Env(GDAL_MAX_DATASET_POOL_SIZE=pool_size):
+        dfo_extract_by_watershed(vrt)
+
+    # build geotiff
+    if "3-Day" in vrt:
+        # DFO_20210603_Flood_3-Day_250m.tiff
+        tiff = "DFO_{datestr}_{layer}.tiff".format(datestr=adate, layer=subfolder)
+        tiff = os.path.join(img_dir, tiff)
+        gdal.Translate(
+            tiff, vrt, format="GTiff", creationOptions=["TILED=YES", "COMPRESS=LZW"]
+        )
+
+    return vrt[:-4] + ".csv"
+
+
+def dfo_tiff_layer(hdffolder, hdffiles, flood, subdataset, adate, outfolder, img_dir):
+    """former processing of a flood layer, for DFO_check: one GeoTIFF per tile
+    with gdal_translate, the vrt over the tiffs
+    return the summary csv of the layer
+    """
+
+    subfolder = flood.replace(" ", "_")
+    tiff_folder = os.path.join(outfolder, subfolder)
+    os.makedirs(tiff_folder, exist_ok=True)
+    tiff_list = []
+    for HDF in hdffiles:
+        nameprefix = "_".join(HDF.split(".")[1:3])
+        inputlayer = f'HDF4_EOS:EOS_GRID:"{os.path.join(hdffolder, HDF)}":Grid_Water_Composite:{subdataset}'
+        outputtiff = os.path.join(tiff_folder, f"{nameprefix}_{subfolder}.tiff")
+        cmd = ["gdal_translate", "-of", "GTiff", "-co", "Tiled=Yes"]
+        subprocess.run(cmd + [inputlayer, outputtiff], check=True)
+        tiff_list.append(outputtiff)
+    vrt = os.path.join(outfolder, f"{subfolder}.vrt")
+    gdal.BuildVRT(vrt, tiff_list)
+    dfo_extract_by_watershed(vrt)
+
+    if "3-Day" in vrt:
+        tiff = os.path.join(img_dir, f"DFO_{adate}_{subfolder}.tiff")
+        cmd = ["gdal_translate", "-co", "TILED=YES", "-co", "COMPRESS=LZW"]
+        subprocess.run(cmd + ["-of", "GTiff", vrt, tiff], check=True)
+
+    return vrt[:-4] + ".csv"
+
+
+def same_raster(tiff_a, tiff_b):
+    """same grid and pixels, compared block by block"""
+
+    with rasterio.open(tiff_a) as a, rasterio.open(tiff_b) as b:
+        grid_a = (a.shape, a.transform, a.crs, a.nodata, a.dtypes)
+        if grid_a != (b.shape, b.transform, b.crs, b.nodata, b.dtypes):
+            return False
+        for _, window in a.block_windows(1):
+            if not np.array_equal(a.read(1, window=window), b.read(1, window=window)):
+                return False
+
+    return True
+
+
+def DFO_check(adate):
+    """check DFO_process against the former per-tile GeoTIFF processing on a
+    day (YYYYMMDD of the current year), and time both
+    -- the day is downloaded if its hdf files are not there, they are kept
+    -- the layer summaries and the 3-Day image are compared, the outputs are
+       written under <day folder>/check and removed if identical
+    return True if identical
+    """
+
+    folder = datetime.strptime(adate, "%Y%m%d").strftime("%j")
+    hdffolder = os.path.join(settings.DFO_PROC_DIR, folder)
+    if not os.path.isdir(hdffolder) or not any(
+        x.endswith(".hdf") for x in os.listdir(hdffolder)
+    ):
+        dfo_download(folder)
+    hdffiles = sorted(x for x in os.listdir(hdffolder) if x.endswith(".hdf"))
+    checkfolder = os.path.join(hdffolder, "check")
+    shutil.rmtree(checkfolder, ignore_errors=True)
+    logging.info(f"DFO check {adate}: {len(hdffiles)} tiles")
+
+    identical = True
+    for flood, subdataset in DFO_FLOOD_LAYERS.items():
+        outputs = {}
+        for path, process in [("vrt", dfo_process_layer), ("tiff", dfo_tiff_layer)]:
+            outfolder = os.path.join(checkfolder, path)
+            os.makedirs(outfolder, exist_ok=True)
+            start = time.perf_counter()
+            outputs[path] = process(
+                hdffolder, hdffiles, flood, subdataset, adate, outfolder, outfolder
+            )
+            seconds = time.perf_counter() - start
+            logging.info(f"DFO check {flood}, {path}: {seconds:.1f} s")
+        same = filecmp.cmp(outputs["vrt"], outputs["tiff"], shallow=False)
+        if "3-Day" in flood:
+            tiff = f"DFO_{adate}_{flood.replace(' ', '_')}.tiff"
+            same = same and same_raster(
+                os.path.join(checkfolder, "vrt", tiff),
+                os.path.join(checkfolder, "tiff", tiff),
+            )
+        logging.info(f"DFO check {flood}: {'identical' if same else 'different'}")
+        identical = identical and same
+
+    if identical:
+        shutil.rmtree(checkfolder)
+
+    return identical
+
+
 def DFO_process(folder, adate):
     """processing dfo folder
+    -- the flood layers are processed in parallel in [dfo] WORKERS processes
 
     folder structure
     allData/61/MCDWD_L3_NRT/2021/021
-        |-Flood 1-Day 250m
-        |-Flood 1-Day CS 250m
-        |-Flood 2-Day 250m
-        |-Flood 3-Day 250m
         Flood_3-Day_250m.vrt
         Flood_2-Day_250m.vrt
         Flood_1-Day_CS_250m.vrt
@@ -248,25 +388,6 @@ def DFO_process(folder, adate):
     # switch to working directory
     os.chdir(hdffolder)
 
-    floodlayer = [
-        "Flood 1-Day 250m",
-        "Flood 1-Day CS 250m",
-        "Flood 2-Day 250m",
-        "Flood 3-Day 250m",
-    ]
-    # new layer name mapping
-    floodsubdataset = {
-        "Flood 1-Day 250m": "Flood_1Day_250m",
-        "Flood 1-Day CS 250m": "FloodCS_1Day_250m",
-        "Flood 2-Day 250m": "Flood_2Day_250m",
-        "Flood 3-Day 250m": "Flood_3Day_250m",
-    }
-    # create sub folder if necessary
-    for flood in floodlayer:
-        subfolder = flood.replace(" ", "_")
-        if not os.path.exists(subfolder):
-            os.mkdir(subfolder)
-
     # MCDWD_L3_NRT.A2021022.h06v04.061.hdf
     # HDF4_EOS:EOS_GRID:"MCDWD_L3_NRT.A2021022.h06v04.061.hdf":Grid_Water_Composite:"Flood 1-Day 250m"
     # HDF4_EOS:EOS_GRID:"MCDWD_L3_NRT.A2021022.h06v04.061.hdf":Grid_Water_Composite:"Flood 1-Day CS 250m"
@@ -291,64 +412,23 @@ def DFO_process(folder, adate):
             logging.warning("Not enough files: " + folder)
             return
 
-    # one step one image operation
-    vrt_list = []
-    for flood in floodlayer:
-        subfolder = flood.replace(" ", "_")
-        subdataset = floodsubdataset[flood]
-        tiff_list = []
-        # geotiff convert
-        for HDF in hdffiles:
-            nameprefix = "_".join(HDF.split(".")[1:3])
-            inputlayer = f'HDF4_EOS:EOS_GRID:"{HDF}":Grid_Water_Composite:{subdataset}'
-            tiff = nameprefix + "_" + subfolder
-            outputtiff = os.path.join(subfolder, tiff + ".tiff")
-            tiff_list.append(outputtiff)
-            if not os.path.exists(outputtiff):
-                # gdal cmd
-                gdalcmd = (
-                    f"gdal_translate -of GTiff -co Tiled=Yes {inputlayer} {outputtiff}"
-                )
-                # convert geotiff
-                os.system(gdalcmd)
-        # build vrt
-        # gdalcmd = f"gdalbuildvrt {subfolder}.vrt {subfolder}/*.tiff"
-        # print(gdalcmd)
-        # os.system(gdalcmd)
-
-        vrt = f"{subfolder}.vrt"
-        gdal.BuildVRT(vrt, tiff_list)
-        vrt_list.append(vrt)
-        # extract flood data
-        dfo_extract_by_watershed(vrt)
-
-        # build geotiff
-        if "3-Day" in vrt:
-            # tiff =  outputfolder + os.path.sep + "DFO_image/DFO_" + datestr + "_" + vrt.replace(".vrt",".tiff")
-            # DFO_20210603_Flood_3-Day_250m.tiff
-            tiff = "DFO_{datestr}_{layer}.tiff".format(datestr=adate, layer=subfolder)
-            tiff = os.path.join(settings.DFO_IMG_DIR, tiff)
-            # gdal_translate -co TILED=YES -co COMPRESS=PACKBITS -of GTiff Flood_1-Day_250m.vrt Flood_1-Day_250m.tiff
-            # gdaladdo -r average Flood_1-Day_250m.tiff 2 4 8 16 32
-            gdalcmd = (
-                f"gdal_translate -co TILED=YES -co COMPRESS=LZW -of GTiff {vrt} {tiff}"
+    # one worker per layer, the HDF4 subdatasets are read in process
+    workers = settings.config.getint("dfo", "WORKERS", fallback=4)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = [
+            executor.submit(
+                dfo_process_layer,
+                hdffolder,
+                hdffiles,
+                flood,
+                subdataset,
+                adate,
             )
-            os.system(gdalcmd)
-            # build overview
-            # gdalcmd = f'gdaladdo -r average {tiff} 2 4 8 16 32'
-            # os.system(gdalcmd)
-
-        # delete tiff folder
-        if os.path.exists(subfolder):
-            shutil.rmtree(subfolder)
+            for flood, subdataset in DFO_FLOOD_LAYERS.items()
+        ]
+        csv_list = [pd.read_csv(x.result()) for x in jobs]
 
     # merge flood data into one file
-    csv_list = []
-    for vrt in vrt_list:
-        csvfile = vrt.replace(".vrt", ".csv")
-        pdc = pd.read_csv(csvfile)
-        csv_list.append(pdc)
-
     merged = csv_list[0].merge(csv_list[1], on="pfaf_id")
     merged = merged.merge(csv_list[2], on="pfaf_id")
     merged = merged.merge(csv_list[3], on="pfaf_id")
@@ -356,6 +436,7 @@ def DFO_process(folder, adate):
     # save output
     summary_csv = os.path.join(settings.DFO_SUM_DIR, "DFO_{}.csv".format(adate))
     merged.to_csv(summary_csv)
+    catalog.register(summary_csv)
     logging.info("generated: " + summary_csv)
 
     # zip the original folder
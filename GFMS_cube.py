@@ -0,0 +1,351 @@
+"""
+GFMS_cube.py
+    -- append-only GFMS datacube, replaces unzipping gfms_YYYYMMDD.zip for
+       historical queries
+    -- gfms_cube.h5: flood depth on the native grid of the bins, time x lat x lon
+    -- gfms_watershed_cube.h5: summary fields, time x watershed x field
+    -- a bin not appended (e.g. the cube is locked by another GFMS job) is kept
+       in GFMS_CUBE_BACKFILL and appended by backfill(), reading the bin from
+       gfms_YYYYMMDD.zip once archived
+    -- backfill(scan=True) appends every archived bin and catalog summary not
+       in the cubes: MoM_run.py -j GFMS_CUBE
+"""
+
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import zipfile
+
+import h5py
+import numpy as np
+import pandas as pd
+from rasterio import Affine
+
+import catalog
+import settings
+
+# native grid of the GFMS bins
+BIN_SHAPE = (800, 2458)
+BIN_PROFILE = {
+    "crs": "EPSG:4326",
+    "transform": Affine(0.125, 0, -127.25, 0, -0.125, 50),
+    "nodata": -9999,
+}
+
+# one day of bins by a small tile: a point series reads one chunk per day,
+# a map reads one chunk row of the day
+DEPTH_CHUNKS = (8, 128, 128)
+# a watershed series and a full time step are both a handful of chunks
+SUMMARY_CHUNKS = (64, 1024)
+SUMMARY_FIELDS = [
+    "GFMS_TotalArea_km",
+    "GFMS_perc_Area",
+    "GFMS_MeanDepth",
+    "GFMS_MaxDepth",
+    "GFMS_Duration",
+]
+# the extraction threads append to the same cube
+_lock = threading.Lock()
+
+
+def read_bin(raw):
+    """depth grid of the bytes of a bin, None if the bin is broken"""
+
+    data = np.frombuffer(raw, dtype="<f4")
+    if data.size != BIN_SHAPE[0] * BIN_SHAPE[1]:
+        return None
+
+    return data.reshape(BIN_SHAPE)
+
+
+def _time_index(cube):
+    """return the time axis as a list of YYYYMMDDHH strings"""
+    return [x.decode() for x in cube["time"][:]]
+
+
+def _append_time(cube, datehour):
+    """extend the time axis by one step, return the new index"""
+    tindex = cube["time"].shape[0]
+    cube["time"].resize((tindex + 1,))
+    cube["time"][tindex] = datehour.encode()
+
+    return tindex
+
+
+def append_depth(datehour, data, profile):
+    """append the depth grid of one bin (YYYYMMDDHH) to the cube"""
+
+    with h5py.File(settings.GFMS_CUBE, "a") as cube:
+        if "depth" not in cube:
+            nrows, ncols = data.shape
+            transform = profile["transform"]
+            cube.create_dataset(
+                "time", shape=(0,), maxshape=(None,), dtype="S10", chunks=(1024,)
+            )
+            cube.create_dataset(
+                "depth",
+                shape=(0, nrows, ncols),
+                maxshape=(None, nrows, ncols),
+                dtype="float32",
+                chunks=DEPTH_CHUNKS,
+                compression="gzip",
+                compression_opts=4,
+                shuffle=True,
+                fillvalue=profile["nodata"],
+            )
+            # pixel centers
+            cube["lon"] = transform.c + transform.a * (np.arange(ncols) + 0.5)
+            cube["lat"] = transform.f + transform.e * (np.arange(nrows) + 0.5)
+            cube["depth"].attrs["nodata"] = profile["nodata"]
+            cube["depth"].attrs["transform"] = list(transform)[:6]
+            cube["depth"].attrs["crs"] = str(profile["crs"])
+        elif cube["depth"].shape[1:] != data.shape:
+            raise ValueError(
+                f"GFMS cube grid {cube['depth'].shape[1:]} is not the bin grid"
+                f" {data.shape}, move the cube away and run MoM_run.py -j GFMS_CUBE"
+            )
+        elif datehour in _time_index(cube):
+            return
+
+        tindex = _append_time(cube, datehour)
+        cube["depth"].resize(tindex + 1, axis=0)
+        cube["depth"][tindex] = data
+
+    return
+
+
+def append_summary(datehour, summary_csv):
+    """append the watershed summary of one bin (YYYYMMDDHH) to the cube"""
+
+    df = pd.read_csv(summary_csv).set_index("pfaf_id")
+
+    with h5py.File(settings.GFMS_WATERSHED_CUBE, "a") as cube:
+        if "summary" not in cube:
+            # the watershed order is fixed by the first summary
+            cube["pfaf_id"] = df.index.to_numpy()
+            cube.create_dataset(
+                "time", shape=(0,), maxshape=(None,), dtype="S10", chunks=(1024,)
+            )
+            cube.create_dataset(
+                "summary",
+                shape=(0, len(df), len(SUMMARY_FIELDS)),
+                maxshape=(None, len(df), len(SUMMARY_FIELDS)),
+                dtype="float64",
+                chunks=(SUMMARY_CHUNKS[0], min(SUMMARY_CHUNKS[1], len(df)))
+                + (len(SUMMARY_FIELDS),),
+                compression="gzip",
+                compression_opts=4,
+                shuffle=True,
+                fillvalue=np.nan,
+            )
+            cube["summary"].attrs["fields"] = SUMMARY_FIELDS
+        elif datehour in _time_index(cube):
+            return
+
+        values = df.reindex(cube["pfaf_id"][:])[SUMMARY_FIELDS].to_numpy()
+        tindex = _append_time(cube, datehour)
+        cube["summary"].resize(tindex + 1, axis=0)
+        cube["summary"][tindex] = values
+
+    return
+
+
+def _select_time(cube, start, end):
+    """indices and values of the time steps in [start, end]"""
+    times = np.array(_time_index(cube))
+    selected = np.ones(len(times), dtype=bool)
+    if start:
+        selected &= times >= start
+    if end:
+        # a prefix end includes the whole period, e.g. all the bins of a day
+        selected &= times <= end.ljust(10, "9")
+    tindex = np.flatnonzero(selected)
+    # the cube is append-only, the steps may not be in time order
+    tindex = tindex[np.argsort(times[tindex])]
+
+    return tindex, times[tindex]
+
+
+def _read_steps(dataset, tindex, selection):
+    """read the time steps in the given order, h5py needs increasing indices"""
+    order = np.argsort(tindex)
+    values = dataset[np.sort(tindex), *selection] if len(tindex) else []
+    result = np.empty_like(values)
+    result[order] = values
+
+    return result
+
+
+def depth_series(lon, lat, start="", end=""):
+    """depth time series at a location
+    -- start/end in YYYYMMDDHH (prefix is fine, e.g. YYYYMMDD)
+    """
+
+    with h5py.File(settings.GFMS_CUBE, "r") as cube:
+        col = int(np.abs(cube["lon"][:] - lon).argmin())
+        row = int(np.abs(cube["lat"][:] - lat).argmin())
+        tindex, times = _select_time(cube, start, end)
+        values = _read_steps(cube["depth"], tindex, (row, col))
+        no_data = cube["depth"].attrs["nodata"]
+
+    series = pd.Series(values, index=pd.to_datetime(times, format="%Y%m%d%H"))
+
+    return series.where(series != no_data)
+
+
+def depth_map(datehour):
+    """depth grid of a time step"""
+
+    with h5py.File(settings.GFMS_CUBE, "r") as cube:
+        tindex = _time_index(cube).index(datehour)
+        return cube["depth"][tindex]
+
+
+def watershed_series(pfaf_id, start="", end=""):
+    """summary time series of a watershed"""
+
+    with h5py.File(settings.GFMS_WATERSHED_CUBE, "r") as cube:
+        windex = int(np.flatnonzero(cube["pfaf_id"][:] == pfaf_id)[0])
+        tindex, times = _select_time(cube, start, end)
+        values = _read_steps(cube["summary"], tindex, (windex, slice(None)))
+
+    return pd.DataFrame(
+        values,
+        index=pd.to_datetime(times, format="%Y%m%d%H"),
+        columns=SUMMARY_FIELDS,
+    )
+
+
+def _load_backfill():
+    if not os.path.exists(settings.GFMS_CUBE_BACKFILL):
+        return {"depth": [], "summary": []}
+    with open(settings.GFMS_CUBE_BACKFILL) as f:
+        return json.load(f)
+
+
+def _save_backfill(backfill):
+    with open(settings.GFMS_CUBE_BACKFILL + ".tmp", "w") as f:
+        json.dump(backfill, f, indent=1)
+    os.replace(settings.GFMS_CUBE_BACKFILL + ".tmp", settings.GFMS_CUBE_BACKFILL)
+
+
+def _retry_later(kind, datehour, e):
+    """keep a bin not appended for backfill()"""
+
+    logging.warning(f"GFMS cube not updated {kind} {datehour}, left to backfill: {e}")
+    backfill = _load_backfill()
+    backfill[kind] = sorted(set(backfill[kind]) | {datehour})
+    _save_backfill(backfill)
+
+
+def append_bin(datehour, data, profile):
+    """append the depth grid of a bin, kept for backfill() if it fails"""
+
+    with _lock:
+        try:
+            append_depth(datehour, data, profile)
+        except (OSError, ValueError) as e:
+            _retry_later("depth", datehour, e)
+
+    return
+
+
+def append_bin_summary(datehour, summary_csv):
+    """append the fixed watershed summary of a bin, kept for backfill() if it
+    fails
+    """
+
+    with _lock:
+        try:
+            append_summary(datehour, summary_csv)
+        except OSError as e:
+            _retry_later("summary", datehour, e)
+
+    return
+
+
+def _archived_bin(datehour):
+    """depth grid of a bin from the processing folder or gfms_YYYYMMDD.zip,
+    None if not found
+    """
+
+    name = f"Flood_byStor_{datehour}.bin"
+    bin_file = os.path.join(settings.GFMS_PROC_DIR, name)
+    if os.path.exists(bin_file):
+        with open(bin_file, "rb") as f:
+            return read_bin(f.read())
+    zipped = os.path.join(settings.GFMS_PROC_DIR, f"gfms_{datehour[:8]}.zip")
+    if os.path.exists(zipped):
+        with zipfile.ZipFile(zipped) as z:
+            if name in z.namelist():
+                return read_bin(z.read(name))
+
+    return None
+
+
+def _cube_times(cube_file):
+    if not os.path.exists(cube_file):
+        return set()
+    with h5py.File(cube_file, "r") as cube:
+        return set(_time_index(cube)) if "time" in cube else set()
+
+
+def _scan():
+    """bins archived in gfms_YYYYMMDD.zip and summaries in the catalog"""
+
+    bins = set()
+    for zipped in glob.glob(os.path.join(settings.GFMS_PROC_DIR, "gfms_*.zip")):
+        with zipfile.ZipFile(zipped) as z:
+            for name in z.namelist():
+                match = re.fullmatch(r"Flood_byStor_(\d{10})\.bin", name)
+                if match:
+                    bins.add(match.group(1))
+    summaries = {x[0] + x[1] for x in catalog.products("GFMS", "summary")}
+
+    return bins, summaries
+
+
+def backfill(scan=False):
+    """append the bins left out of the cubes
+    -- scan: also every archived bin and catalog summary not in the cubes
+    -- stops at the first failed append, the rest is kept for the next run
+    """
+
+    with _lock:
+        backfill = _load_backfill()
+        if scan:
+            bins, summaries = _scan()
+            bins -= _cube_times(settings.GFMS_CUBE)
+            summaries -= _cube_times(settings.GFMS_WATERSHED_CUBE)
+            backfill["depth"] = sorted(set(backfill["depth"]) | bins)
+            backfill["summary"] = sorted(set(backfill["summary"]) | summaries)
+        if not (backfill["depth"] or backfill["summary"]):
+            return
+
+        try:
+            for datehour in list(backfill["depth"]):
+                data = _archived_bin(datehour)
+                if data is None:
+                    logging.warning(f"GFMS cube backfill: bin not found {datehour}")
+                else:
+                    append_depth(datehour, data, BIN_PROFILE)
+                backfill["depth"].remove(datehour)
+            for datehour in list(backfill["summary"]):
+                summary_csv = os.path.join(
+                    settings.GFMS_SUM_DIR, f"Flood_byStor_{datehour}.csv"
+                )
+                if os.path.exists(summary_csv):
+                    append_summary(datehour, summary_csv)
+                backfill["summary"].remove(datehour)
+        except (OSError, ValueError) as e:
+            logging.warning(f"GFMS cube backfill stopped: {e}")
+        _save_backfill(backfill)
+        logging.info(
+            f"GFMS cube backfill: {len(backfill['depth'])} bins,"
+            f" {len(backfill['summary'])} summaries left"
+        )
+
+    return
@@ -3,19 +3,25 @@ GFMS_tool.py
 
 Download and process GFMS and GloFAS data
 
-Two main function:
+Three main function:
     * GFMS_cron : run the daily cron job
     * GFMS_cron_fix: rerun cron-job for a given date
+    * GFMS_incremental: process GFMS bins as soon as they are published
 """
 
+import contextlib
 import csv
 import glob
 import json
 import logging
 import math
 import os
-import sys
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from ftplib import FTP, all_errors, error_perm
 
 import geopandas
 import numpy as np
@@ -26,42 +32,222 @@ import zipfile
 from rasterio import Affine  # or from affine import Affine
 from rasterio.mask import mask
 
+import GFMS_cube
+import catalog
 from GFMS_MoM import flood_severity
 
 # from HWRF_MoM import update_HWRF_MoM, update_HWRFMoM_DFO_VIIRS, final_alert_pdc
 from HWRF_MoM import hwrf_workflow
 import settings
-from utilities import findLatest, hwrf_today, watersheds_gdb_reader
+from utilities import GLOFAS_COLUMNS, from_today, hwrf_today, watersheds_gdb_reader
 
 # no need for cron-job
 # from progressbar import progress
 
-
-def GloFAS_download():
-    """download glofas data from ftp"""
+# the vrt doubles the resolution of the native grid of the bins
+GFMS_NODATA = GFMS_cube.BIN_PROFILE["nodata"]
+GFMS_VRT_PROFILE = {
+    "crs": "EPSG:4326",
+    "transform": Affine(0.0625, 0, -127.25, 0, -0.0625, 50),
+    "nodata": GFMS_NODATA,
+}
+# summary fields with a daily maximum taken at extraction
+GFMS_DAILY_FIELDS = [
+    "GFMS_TotalArea_km",
+    "GFMS_perc_Area",
+    "GFMS_MeanDepth",
+    "GFMS_MaxDepth",
+]
+# the extraction threads add the bins of a date to the same daily products
+_daily_lock = threading.Lock()
+
+
+def GloFAS_ftpsite():
+    """glofas ftp settings from the config"""
     ftpsite = {}
     ftpsite["host"] = settings.config.get("glofas", "HOST")
+    ftpsite["port"] = settings.config.getint("glofas", "PORT", fallback=21)
     ftpsite["user"] = settings.config.get("glofas", "USER") if "???" not in settings.config.get("glofas", "USER") else os.getenv("AUTH_GLOFAS_USER")
     ftpsite["passwd"] = settings.config.get("glofas", "PASSWD") if "???" not in settings.config.get("glofas", "PASSWD") else os.getenv("AUTH_GLOFAS_PASSWD")
     ftpsite["directory"] = settings.config.get("glofas", "DIRECTORY")
-    from ftplib import FTP
 
-    ftp = FTP(host=ftpsite["host"], user=ftpsite["user"], passwd=ftpsite["passwd"])
+    return ftpsite
+
+
+def _glofas_connect(ftpsite):
+    """open a ftp connection in the glofas directory"""
+    ftp = FTP()
+    ftp.connect(host=ftpsite["host"], port=ftpsite["port"])
+    ftp.login(user=ftpsite["user"], passwd=ftpsite["passwd"])
     ftp.cwd(ftpsite["directory"])
-    file_list = ftp.nlst()
-    job_list = []
-    for txt in file_list:
+
+    return ftp
+
+
+def _glofas_listing(ftp):
+    """name -> size/modify of the remote files
+    -- MLSD if the server supports it, otherwise NLST + SIZE/MDTM
+    """
+    listing = {}
+    try:
+        for name, facts in ftp.mlsd(facts=["type", "size", "modify"]):
+            if facts.get("type", "file") != "file":
+                continue
+            listing[name] = {"size": facts.get("size"), "modify": facts.get("modify")}
+    except error_perm:
+        names = ftp.nlst()
+        # SIZE is refused in ascii mode
+        ftp.voidcmd("TYPE I")
+        for name in names:
+            try:
+                size = str(ftp.size(name))
+                modify = ftp.sendcmd("MDTM " + name)[4:].strip()
+            except error_perm:
+                # directories and servers without SIZE/MDTM, always fetched
+                size, modify = None, None
+            listing[name] = {"size": size, "modify": modify}
+
+    return listing
+
+
+def _glofas_fetch(ftpsite, names):
+    """download files over a single connection, return the fetched names
+    -- a failed file is skipped, the connection is reopened for the next
+       file after a connection error
+    """
+    fetched = []
+    ftp = None
+    for txt in names:
         save_txt = os.path.join(settings.GLOFAS_PROC_DIR, txt)
+        try:
+            if ftp is None:
+                ftp = _glofas_connect(ftpsite)
+            with open(save_txt + ".part", "wb") as fp:
+                ftp.retrbinary("RETR " + txt, fp.write)
+            os.replace(save_txt + ".part", save_txt)
+            fetched.append(txt)
+        except all_errors as e:
+            logging.error(f"GloFAS download failed {txt}: {e}")
+            if ftp is not None and not isinstance(e, error_perm):
+                ftp.close()
+                ftp = None
+        finally:
+            if os.path.exists(save_txt + ".part"):
+                os.remove(save_txt + ".part")
+    if ftp is not None:
+        try:
+            ftp.quit()
+        except all_errors:
+            ftp.close()
 
-        # add date to job list. Even if GloFAS file already exists, it's not a guarantee it was processed
-        if "threspoints_" in txt:
-            job_list.append((txt.split(".")[0]).replace("threspoints_", ""))
+    return fetched
 
-        with open(save_txt, "wb") as fp:
-            ftp.retrbinary("RETR " + txt, fp.write)
 
+def GloFAS_download(ftpsite=None):
+    """download new or changed glofas files from ftp
+    -- the size/modify of the downloaded files are kept in GLOFAS_MANIFEST,
+       only to skip the downloads
+    -- return the dates of the new or changed threspoints_ files and of the
+       listed ones of the last RETRY_DAYS days not processed yet (no GFMS MoM
+       output in the catalog)
+    """
+    if ftpsite is None:
+        ftpsite = GloFAS_ftpsite()
+    connections = settings.config.getint("glofas", "CONNECTIONS", fallback=1)
+    retry_days = settings.config.getint("glofas", "RETRY_DAYS", fallback=7)
+
+    manifest = {}
+    if os.path.exists(settings.GLOFAS_MANIFEST):
+        with open(settings.GLOFAS_MANIFEST) as f:
+            manifest = json.load(f)
+
+    ftp = _glofas_connect(ftpsite)
+    listing = _glofas_listing(ftp)
     ftp.quit()
-    return job_list
+
+    new_files = [
+        txt
+        for txt, facts in sorted(listing.items())
+        if facts["size"] is None
+        or manifest.get(txt) != facts
+        or not os.path.exists(os.path.join(settings.GLOFAS_PROC_DIR, txt))
+    ]
+    fetched = []
+    if new_files:
+        logging.info(f"GloFAS: {len(new_files)} new files of {len(listing)}")
+
+        # split the files over the connections
+        batches = [new_files[i::connections] for i in range(connections)]
+        batches = [x for x in batches if x]
+        with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+            results = executor.map(lambda x: _glofas_fetch(ftpsite, x), batches)
+            fetched = [txt for batch in results for txt in batch]
+
+        for txt in fetched:
+            manifest[txt] = listing[txt]
+        with open(settings.GLOFAS_MANIFEST + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(settings.GLOFAS_MANIFEST + ".tmp", settings.GLOFAS_MANIFEST)
+
+    job_list = set()
+    for txt in listing:
+        if "threspoints_" not in txt:
+            continue
+        data_date = (txt.split(".")[0]).replace("threspoints_", "")
+        if txt in fetched:
+            job_list.add(data_date)
+        # a downloaded file is not a guarantee it was processed, e.g. the GFMS
+        # bins were not online yet; the older dates are not offered again
+        elif (
+            from_today(data_date) + retry_days >= 0
+            and os.path.exists(os.path.join(settings.GLOFAS_PROC_DIR, txt))
+            and not catalog.exists("GFMS", "mom", data_date[:-2])
+        ):
+            job_list.add(data_date)
+
+    return sorted(job_list)
+
+
+def GloFAS_pfaf_lookup(total_data, watersheds):
+    """(Lon, Lat) -> pfaf_id of the glofas stations
+    -- kept in GLOFAS_PFAF_CACHE, only unseen stations are joined
+    -- pfaf_id is -1 for stations outside of the watersheds
+    """
+    if os.path.exists(settings.GLOFAS_PFAF_CACHE):
+        lookup = pd.read_csv(settings.GLOFAS_PFAF_CACHE)
+    else:
+        lookup = pd.DataFrame(
+            {
+                "Lon": pd.Series(dtype=float),
+                "Lat": pd.Series(dtype=float),
+                "pfaf_id": pd.Series(dtype=int),
+            }
+        )
+
+    stations = total_data[["Lon", "Lat"]].drop_duplicates()
+    seen = lookup[["Lon", "Lat"]].drop_duplicates()
+    unseen = stations.merge(seen, how="left", indicator=True)
+    unseen = unseen.loc[unseen["_merge"] == "left_only", ["Lon", "Lat"]]
+    if unseen.empty:
+        return lookup
+
+    logging.info(f"GloFAS: {len(unseen)} new stations")
+    gdf = geopandas.GeoDataFrame(
+        unseen,
+        geometry=geopandas.points_from_xy(unseen.Lon, unseen.Lat),
+        crs="EPSG:4326",
+    )
+    joined = geopandas.sjoin(gdf, watersheds, predicate="within")
+    joined.rename(columns={"index_right": "pfaf_id"}, inplace=True)
+    # a station within several watersheds has a row for each of them
+    unseen = unseen.join(joined["pfaf_id"])
+    unseen["pfaf_id"] = unseen["pfaf_id"].fillna(-1).astype(int)
+
+    lookup = pd.concat([lookup, unseen], ignore_index=True)
+    lookup.to_csv(settings.GLOFAS_PFAF_CACHE + ".tmp", index=False)
+    os.replace(settings.GLOFAS_PFAF_CACHE + ".tmp", settings.GLOFAS_PFAF_CACHE)
+
+    return lookup
 
 
 def GloFAS_process():
@@ -71,7 +257,10 @@ def GloFAS_process():
 
     if len(processing_dates) == 0:
         logging.info("no new glofas file to process!")
-        sys.exit()
+        return []
+
+    # GeoJSON is the slowest writer, kept for the existing consumers
+    write_geojson = settings.config.getboolean("glofas", "GEOJSON", fallback=True)
 
     # load watersheds data
     watersheds = watersheds_gdb_reader()
@@ -82,7 +271,14 @@ def GloFAS_process():
         out_geojson = os.path.join(
             settings.GLOFAS_DIR, "threspoints_" + data_date + ".geojson"
         )
-        if os.path.exists(out_csv) and os.path.exists(out_geojson):
+        out_parquet = os.path.join(
+            settings.GLOFAS_DIR, "threspoints_" + data_date + ".parquet"
+        )
+        out_fgb = os.path.join(settings.GLOFAS_DIR, "threspoints_" + data_date + ".fgb")
+        outputs = [out_csv, out_parquet, out_fgb]
+        if write_geojson:
+            outputs.append(out_geojson)
+        if all(os.path.exists(x) for x in outputs):
             continue
 
         logging.info("processing GLoFAS: " + data_date)
@@ -197,18 +393,22 @@ def GloFAS_process():
             total_data = fixed_data
             print("dyn_data is ignored")
 
-        # create a geopanda dataset
-        gdf = geopandas.GeoDataFrame(
+        # pfaf_id of the stations, same rows and columns as the sjoin
+        # of the stations within the watersheds
+        lookup = GloFAS_pfaf_lookup(total_data, watersheds)
+        total_data = (
+            total_data.reset_index()
+            .merge(lookup, on=["Lon", "Lat"])
+            .set_index("index")
+            .rename_axis(None)
+        )
+        total_data = total_data[total_data["pfaf_id"] != -1]
+        total_data = total_data.join(watersheds.drop(columns="geometry"), on="pfaf_id")
+        gdf_watersheds = geopandas.GeoDataFrame(
             total_data,
             geometry=geopandas.points_from_xy(total_data.Lon, total_data.Lat),
         )
-        gdf.crs = "EPSG:4326"
-        # generate sindex
-        gdf.sindex
-
-        # sjoin
-        gdf_watersheds = geopandas.sjoin(gdf, watersheds, predicate="within")
-        gdf_watersheds.rename(columns={"index_right": "pfaf_id"}, inplace=True)
+        gdf_watersheds.crs = "EPSG:4326"
 
         forcast_time = (fixed_sites.split("_")[1]).replace("00.txt", "")
         forcast_time = datetime.strptime(forcast_time, "%Y%m%d")
@@ -216,67 +416,67 @@ def GloFAS_process():
         gdf_watersheds["Forecast Date"] = forcast_time.isoformat()
 
         # convert "GloFAS_2yr","GloFAS_5yr","GloFAS_20y" to 0~100
+        eps_columns = ["GloFAS_2yr", "GloFAS_5yr", "GloFAS_20yr"]
         if gdf_watersheds["GloFAS_2yr"].max() <= 1.0:
-            gdf_watersheds["GloFAS_2yr"] = gdf_watersheds["GloFAS_2yr"] * 100
-            gdf_watersheds["GloFAS_5yr"] = gdf_watersheds["GloFAS_5yr"] * 100
-            gdf_watersheds["GloFAS_20yr"] = gdf_watersheds["GloFAS_20yr"] * 100
-        gdf_watersheds = gdf_watersheds.astype(
-            {"GloFAS_2yr": int, "GloFAS_5yr": int, "GloFAS_20yr": int}
-        )
+            gdf_watersheds[eps_columns] = gdf_watersheds[eps_columns] * 100
+        gdf_watersheds = gdf_watersheds.astype(dict.fromkeys(eps_columns, int))
 
         # fill max_EPS
-        gdf_watersheds["max_EPS"] = gdf_watersheds.apply(
-            lambda row: str(row["GloFAS_2yr"])
-            + "/"
-            + str(row["GloFAS_5yr"])
-            + "/"
-            + str(row["GloFAS_20yr"]),
-            axis=1,
+        eps = gdf_watersheds[eps_columns].astype(str)
+        gdf_watersheds["max_EPS"] = (
+            eps["GloFAS_2yr"] + "/" + eps["GloFAS_5yr"] + "/" + eps["GloFAS_20yr"]
         )
 
         # write out csv file
-        out_columns = [
-            "Point No",
-            "Station",
-            "Basin",
-            "Country",
-            "Lat",
-            "Lon",
-            "Upstream area",
-            "Forecast Date",
-            "max_EPS",
-            "GloFAS_2yr",
-            "GloFAS_5yr",
-            "GloFAS_20yr",
-            "Alert_level",
-            "Days_until_peak",
-            "pfaf_id",
-        ]
         gdf_watersheds.to_csv(
-            out_csv, index=False, columns=out_columns, float_format="%.3f"
+            out_csv, index=False, columns=GLOFAS_COLUMNS, float_format="%.3f"
         )
+        catalog.register(out_csv)
         logging.info("generated: " + out_csv)
 
         # write to excel
         # out_excel = glofasdata + "threspoints_" + data_date + ".xlsx"
         # gdf_watersheds.to_excel(out_excel,index=False,columns=out_columns,sheet_name='Sheet_name_1')
 
+        # columnar outputs, read by the MoM stages
+        gdf_watersheds.to_parquet(out_parquet, index=False)
+        logging.info("generated: " + out_parquet)
+        gdf_watersheds.to_file(out_fgb, driver="FlatGeobuf")
+        logging.info("generated: " + out_fgb)
+
         # to geojson
-        gdf_watersheds.to_file(out_geojson, driver="GeoJSON")
-        logging.info("generated: " + out_geojson)
+        if write_geojson:
+            gdf_watersheds.to_file(out_geojson, driver="GeoJSON")
+            logging.info("generated: " + out_geojson)
 
     # return a list date to be processed with GFMS
     return processing_dates
 
 
-def GFMS_download(bin_file):
-    """download a given bin file"""
+def GFMS_bin_url(bin_file):
+    """return the download url of a given bin file"""
 
-    # find download url
     datestr = bin_file.split("_")[2]
     baseurl = settings.config.get("gfms", "HOST")
     dataurl = f"{baseurl.rstrip('/')}/{datestr[:4]}/{datestr[:6]}"
-    download_data_url = f"{dataurl.rstrip('/')}/{bin_file}"
+
+    return f"{dataurl.rstrip('/')}/{bin_file}"
+
+
+def GFMS_bin_online(bin_file):
+    """check if a given bin file is published"""
+    try:
+        r = requests.head(GFMS_bin_url(bin_file), allow_redirects=True, timeout=10)
+        return r.status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+
+def GFMS_download(bin_file):
+    """download a given bin file"""
+
+    # find download url
+    download_data_url = GFMS_bin_url(bin_file)
 
     # check if .bin is already downloaded
     binfile_local = os.path.join(settings.GFMS_PROC_DIR, bin_file)
@@ -415,7 +615,9 @@ def GFMS_extract_by_mask(vrt_file, mask_json):
 
 
 def GFMS_extract_by_watershed(vrt_file):
-    """extract and summary"""
+    """extract and summary
+    return the summary as a dataframe, None if already processed
+    """
 
     # load watersheds data
     watersheds = watersheds_gdb_reader()
@@ -444,6 +646,7 @@ def GFMS_extract_by_watershed(vrt_file):
 
     # write out the summary
     # count = 0
+    rows = []
     with open(summary_file, "a") as f:
         writer = csv.writer(f)
 
@@ -485,9 +688,22 @@ def GFMS_extract_by_watershed(vrt_file):
                 GFMS_Duration,
             ]
             writer.writerow(results_list)
+            rows.append(results_list)
 
     logging.info("generated: " + summary_file)
 
+    return pd.DataFrame(rows, columns=headers_list)
+
+
+def GFMS_tiff(vrt_file):
+    """generate tiff from a given vrt file"""
+
+    tiff_name = os.path.basename(vrt_file).replace(".vrt", ".tiff")
+    tiff_file = os.path.join(settings.GFMS_IMG_DIR, tiff_name)
+    gdalcmd = f"gdal_translate -co TILED=YES -co COMPRESS=LZW -of GTiff {vrt_file} {tiff_file}"
+    os.system(gdalcmd)
+    logging.info("generated: " + tiff_file)
+
     return
 
 
@@ -502,37 +718,244 @@ def GFMS_data_extractor(bin_file):
         return
 
     # extract data by watershed
-    logging.info("processing: " + vrt_file)
-    GFMS_extract_by_watershed(vrt_file)
+    GFMS_extract_bin(vrt_file)
 
     # generate tiff from bin file
-    tiff_name = os.path.basename(vrt_file).replace(".vrt", ".tiff")
-    tiff_file = os.path.join(settings.GFMS_IMG_DIR, tiff_name)
-    gdalcmd = f"gdal_translate -co TILED=YES -co COMPRESS=LZW -of GTiff {vrt_file} {tiff_file}"
-    os.system(gdalcmd)
-    logging.info("generated: " + tiff_file)
+    GFMS_tiff(vrt_file)
+
+    return
+
+
+def GFMS_read_bin(bin_file):
+    """depth grid of a bin on its native grid, None if the file is broken"""
+
+    with open(os.path.join(settings.GFMS_PROC_DIR, bin_file), "rb") as f:
+        data = GFMS_cube.read_bin(f.read())
+    if data is None:
+        logging.warning("broken bin file: " + bin_file)
+
+    return data
+
+
+def _vrt_grid(data):
+    """native grid on the grid of the vrt, nearest neighbour as the vrt warp"""
+    return data.repeat(2, axis=0).repeat(2, axis=1)
+
+
+def _daily_state_file(real_date):
+    return os.path.join(
+        settings.GFMS_PROC_DIR, f"Flood_byStor_{real_date}_daily.npz"
+    )
+
+
+def GFMS_daily_state(real_date):
+    """bins of a date accumulated so far, None if no bin"""
+
+    state_file = _daily_state_file(real_date)
+    if not os.path.exists(state_file):
+        return None
+    with np.load(state_file) as f:
+        return {key: f[key].copy() for key in f.files}
+
+
+def GFMS_daily_accumulate(vrt_file, summary):
+    """add a bin to the daily products of its date while it is in memory
+    -- running max/sum/count of the depth and the maxima of the watershed
+       summary, kept in Flood_byStor_YYYYMMDD_daily.npz until the date is archived
+    -- summary: the watershed summary of the bin, None to read its csv
+    """
+
+    # Flood_byStor_YYYYMMDDHH.vrt
+    datehour = os.path.basename(vrt_file)[13:23]
+    real_date = datehour[:8]
+    data = GFMS_read_bin(os.path.basename(vrt_file).replace(".vrt", ".bin"))
+    if data is None:
+        return
+    if summary is None:
+        summary = pd.read_csv(vrt_file.replace(".vrt", ".csv"))
+    summary = summary.set_index("pfaf_id")[GFMS_DAILY_FIELDS]
+
+    GFMS_cube.append_bin(datehour, data, GFMS_cube.BIN_PROFILE)
+
+    with _daily_lock:
+        state = GFMS_daily_state(real_date)
+        if state is None:
+            state = {
+                "bins": np.array([], dtype="S10"),
+                "max_depth": np.full(
+                    GFMS_cube.BIN_SHAPE, GFMS_NODATA, dtype=np.float32
+                ),
+                "sum_depth": np.zeros(GFMS_cube.BIN_SHAPE, dtype=np.float64),
+                "bin_count": np.zeros(GFMS_cube.BIN_SHAPE, dtype=np.uint8),
+                "pfaf_id": summary.index.to_numpy(),
+                "summary_max": summary.to_numpy(dtype=np.float64),
+            }
+        elif datehour.encode() in state["bins"]:
+            return
+        else:
+            values = summary.reindex(state["pfaf_id"]).to_numpy(dtype=np.float64)
+            state["summary_max"] = np.fmax(state["summary_max"], values)
+
+        valid = data != GFMS_NODATA
+        np.maximum(state["max_depth"], data, out=state["max_depth"], where=valid)
+        state["sum_depth"][valid] += data[valid]
+        state["bin_count"][valid] += 1
+        state["bins"] = np.append(state["bins"], datehour.encode())
+
+        state_file = _daily_state_file(real_date)
+        with open(state_file + ".part", "wb") as f:
+            np.savez(f, **state)
+        os.replace(state_file + ".part", state_file)
+
+    return
+
+
+def GFMS_extract_bin(vrt_file):
+    """summarize a bin by watershed, add it to the daily products"""
+
+    logging.info("processing: " + vrt_file)
+    summary = GFMS_extract_by_watershed(vrt_file)
+    GFMS_daily_accumulate(vrt_file, summary)
+
+    return
+
+
+def _pipeline_stage(name, func, inbox, outbox, stats):
+    """run func on every item of inbox, pass the results to outbox
+    -- None is the end marker, one per worker
+    -- the depth of inbox is sampled at each item, the items waiting for
+       the stage
+    """
+
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        depth = inbox.qsize()
+        start = time.time()
+        try:
+            result = func(item)
+        except Exception as e:
+            logging.error(f"GFMS {name} failed {item}: {e}")
+            result = None
+        with stats["lock"]:
+            stats[name]["count"] += 1
+            stats[name]["busy"] += time.time() - start
+            stats[name]["depth_max"] = max(stats[name]["depth_max"], depth)
+            stats[name]["depth_sum"] += depth
+        if outbox is not None and result:
+            outbox.put(result)
+            logging.debug(f"GFMS {name}: {item}, queue depth {outbox.qsize()}")
+
+
+def GFMS_pipeline(bin_list):
+    """download, extract and translate bins in a pipeline
+    -- download prefetches up to PREFETCH vrt files ahead of the extraction
+    -- EXTRACT_WORKERS threads summarize by watershed and add the bins to the
+       daily products
+    -- gdal_translate runs in the background on its own queue
+    """
+
+    prefetch = settings.config.getint("gfms", "PREFETCH", fallback=4)
+    workers = settings.config.getint("gfms", "EXTRACT_WORKERS", fallback=2)
+
+    def extract(vrt_file):
+        GFMS_extract_bin(vrt_file)
+        return vrt_file
+
+    bin_queue = queue.Queue()
+    vrt_queue = queue.Queue(maxsize=prefetch)
+    tiff_queue = queue.Queue()
+    stats = {"lock": threading.Lock()}
+    for name in ["download", "extract", "tiff"]:
+        stats[name] = {"count": 0, "busy": 0.0, "depth_max": 0, "depth_sum": 0}
+
+    stages = [
+        threading.Thread(
+            target=_pipeline_stage,
+            args=("download", GFMS_download, bin_queue, vrt_queue, stats),
+        )
+    ]
+    extractors = [
+        threading.Thread(
+            target=_pipeline_stage,
+            args=("extract", extract, vrt_queue, tiff_queue, stats),
+        )
+        for _ in range(workers)
+    ]
+    stages.append(
+        threading.Thread(
+            target=_pipeline_stage,
+            args=("tiff", GFMS_tiff, tiff_queue, None, stats),
+        )
+    )
+
+    start = time.time()
+    for bin_file in bin_list:
+        bin_queue.put(bin_file)
+    bin_queue.put(None)
+    for t in stages + extractors:
+        t.start()
+
+    # shut down stage by stage
+    stages[0].join()
+    for _ in extractors:
+        vrt_queue.put(None)
+    for t in extractors:
+        t.join()
+    tiff_queue.put(None)
+    stages[1].join()
+
+    elapsed = time.time() - start
+    for name in ["download", "extract", "tiff"]:
+        count, busy = stats[name]["count"], stats[name]["busy"]
+        depth_mean = stats[name]["depth_sum"] / count if count else 0
+        logging.info(
+            f"GFMS pipeline {name}: {count} bins, busy {busy:.1f}s, "
+            f"{count / elapsed * 3600 if elapsed else 0:.1f} bins/hour, "
+            f"queue depth max {stats[name]['depth_max']} mean {depth_mean:.1f}"
+        )
 
     return
 
 
 def GFMS_fix_duration(csv0, csvlist):
-    """fix duration"""
+    """fix duration
+    return the maximum fixed duration by pfaf_id over csvlist, None if empty
+    """
     # notice the folder issue
     # base0 shall be in GFMS_SUM_DIR
     # unfixed are in GFMS_PROC_DIR
 
+    if len(csvlist) == 0:
+        return None
+
     # first check if csv0 exists
     basecsv = os.path.join(settings.GFMS_SUM_DIR, csv0)
+    firstcsv = os.path.join(settings.GFMS_SUM_DIR, csvlist[0])
     if os.path.exists(basecsv):
         df0 = pd.read_csv(basecsv)
         start_in = 0
+    elif os.path.exists(firstcsv):
+        df0 = pd.read_csv(firstcsv)
+        start_in = 1
     else:
         df0 = pd.read_csv(os.path.join(settings.GFMS_PROC_DIR, csvlist[0]))
         start_in = 1
         # also write out to SUM folder
-        df0.to_csv(os.path.join(settings.GFMS_SUM_DIR, csvlist[0]), index=False)
+        df0.to_csv(firstcsv, index=False)
+        catalog.register(firstcsv)
+        GFMS_cube.append_bin_summary(csvlist[0][13:23], firstcsv)
+    fixed = [df0] if start_in == 1 else []
 
     for name in csvlist[start_in:]:
+        # already fixed, e.g. by GFMS_incremental
+        fix_csv = os.path.join(settings.GFMS_SUM_DIR, name)
+        if os.path.exists(fix_csv):
+            df0 = pd.read_csv(fix_csv)
+            fixed.append(df0)
+            continue
+
         csv_file = os.path.join(settings.GFMS_PROC_DIR, name)
 
         # TODO: handle missing file
@@ -548,32 +971,94 @@ def GFMS_fix_duration(csv0, csvlist):
             axis=1,
         )
         del df["GFMS_Duration0"]
-        fix_csv = os.path.join(settings.GFMS_SUM_DIR, name)
         df.to_csv(fix_csv, index=False)
+        catalog.register(fix_csv)
+        GFMS_cube.append_bin_summary(name[13:23], fix_csv)
         logging.info("generated: " + fix_csv)
+        fixed.append(df)
         df0 = None
         df0 = df
         df = None
 
+    return pd.concat(fixed).groupby("pfaf_id")["GFMS_Duration"].max()
+
+
+@contextlib.contextmanager
+def _date_lock(real_date):
+    """lock file of a date in GFMS_PROC_DIR, held while its bins are processed
+    -- GFMS_cron and GFMS_incremental may run at the same time on a date
+    -- yield False if another job holds the lock, a lock older than
+       [gfms] LOCK_HOURS is left by a killed job and taken over
+    """
+
+    lock_file = os.path.join(settings.GFMS_PROC_DIR, f"gfms_{real_date}.lock")
+    lock_hours = settings.config.getint("gfms", "LOCK_HOURS", fallback=6)
+    try:
+        if time.time() - os.path.getmtime(lock_file) > lock_hours * 3600:
+            logging.warning("removed a stale lock: " + lock_file)
+            os.remove(lock_file)
+    except FileNotFoundError:
+        pass
+
+    try:
+        fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        logging.info(f"GFMS {real_date} is processed by another job")
+        yield False
+        return
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield True
+    finally:
+        os.remove(lock_file)
+
 
 def GFMS_processing(proc_dates_list):
-    """process GFMS data with a given list of dates"""
+    """process GFMS data with a given list of dates
+    -- the dates locked by another GFMS job are skipped, they are offered
+       again on the next run
+    """
+
+    with contextlib.ExitStack() as stack:
+        proc_dates_list = [
+            x for x in proc_dates_list if stack.enter_context(_date_lock(x[:-2]))
+        ]
+        if len(proc_dates_list) > 0:
+            _GFMS_process_dates(proc_dates_list)
+
+    return
+
+
+def _GFMS_process_dates(proc_dates_list):
+    """process the bins of the dates, then the daily products"""
 
     binhours = ["00", "03", "06", "09", "12", "15", "18", "21"]
+    bin_list = []
     for data_date in proc_dates_list:
         real_date = data_date[:-2]
         for binhour in binhours:
             bin_file = "Flood_byStor_" + real_date + binhour + ".bin"
-            # process bin file, generate .csv - some might be missing
-            GFMS_data_extractor(bin_file)
+            # skip the bin already processed by GFMS_incremental
+            if os.path.exists(
+                os.path.join(settings.GFMS_SUM_DIR, bin_file.replace(".bin", ".csv"))
+            ):
+                continue
+            bin_list.append(bin_file)
 
+    # process bin files, generate .csv - some might be missing
+    # all the bins are done before any date is archived
+    GFMS_pipeline(bin_list)
+
+    for data_date in proc_dates_list:
+        real_date = data_date[:-2]
         # run duration caculation
         # find the previous one, previous day 21 hour
         previous_date = datetime.strptime(real_date, "%Y%m%d") - timedelta(days=1)
         base0 = "Flood_byStor_" + previous_date.strftime("%Y%m%d") + "21.csv"
         fix_list = ["Flood_byStor_" + real_date + x + ".csv" for x in binhours]
         # call fix duration
-        GFMS_fix_duration(base0, fix_list)
+        duration_max = GFMS_fix_duration(base0, fix_list)
 
         # flood severity calculation
         # take the first file of each day ("00" hour bin)
@@ -586,36 +1071,188 @@ def GFMS_processing(proc_dates_list):
 
         # in case of glofascsv data is missing, use the latest
         if not os.path.exists(glofascsv):
-            glofas_latest = findLatest(settings.GLOFAS_DIR, "csv")
-            glofascsv = os.path.join(settings.GLOFAS_DIR, glofas_latest)
-
-        # set directory for adding/removing files
-        os.chdir(settings.GFMS_PROC_DIR)
+            _, _, glofascsv = catalog.latest("GloFAS", "summary")
 
         # TODO: handle missing file
         # if os.path.exists(glofascsv) and os.path.exists(gfmscsv):
         # only proceed if valid data is present
         flood_severity(gfmscsv, glofascsv, real_date)
 
+        # daily products before the bins are zipped
+        GFMS_daily_products(real_date, duration_max)
+
         # zip GFMS data after processing
-        zipped = f"gfms_{real_date}.zip"
+        GFMS_archive(real_date)
+
+    return
 
-        # os-agnostic process
-        with zipfile.ZipFile(zipped, "w") as z:
-            for f in glob.glob(f"Flood_byStor_{real_date}*.*"):
-                z.write(f, arcname=os.path.basename(f))  # match shell zip behavior
 
-        logging.info("generated: " + zipped)
+def GFMS_daily_products(real_date, duration_max=None):
+    """daily products from the bins of a date accumulated at extraction
+    -- Flood_byStor_YYYYMMDD_daily.tiff in GFMS_IMG_DIR
+        band 1: maximum depth, band 2: mean depth of the accumulated bins
+    -- Flood_byStor_YYYYMMDD_dailymax.csv in GFMS_SUM_DIR
+        daily maxima of the summary fields per watershed, GFMS_Duration is
+        the maximum fixed duration (duration_max)
+    """
 
-        # remove all the files
-        for filePath in glob.glob(f"Flood_byStor_{real_date}*.*"):
-            try:
-                os.remove(filePath)
-            except:
-                logging.warning("Error while deleting file : ", filePath)
+    # bins left out of the datacube by a failed append
+    GFMS_cube.backfill()
 
-        curdir = os.getcwd()
-        os.chdir(curdir)
+    state = GFMS_daily_state(real_date)
+    if state is None:
+        return
+
+    composite_tiff = os.path.join(
+        settings.GFMS_IMG_DIR, f"Flood_byStor_{real_date}_daily.tiff"
+    )
+    if not os.path.exists(composite_tiff):
+        bin_count = state["bin_count"]
+        mean_depth = np.full(bin_count.shape, GFMS_NODATA, dtype=np.float32)
+        np.divide(
+            state["sum_depth"],
+            bin_count,
+            out=mean_depth,
+            where=bin_count > 0,
+            casting="unsafe",
+        )
+        max_depth = _vrt_grid(state["max_depth"])
+        profile = dict(
+            GFMS_VRT_PROFILE,
+            driver="GTiff",
+            height=max_depth.shape[0],
+            width=max_depth.shape[1],
+            count=2,
+            dtype="float32",
+            tiled=True,
+            blockxsize=256,
+            blockysize=256,
+            compress="lzw",
+        )
+        with rasterio.open(composite_tiff, "w", **profile) as dst:
+            dst.write(max_depth, 1)
+            dst.write(_vrt_grid(mean_depth), 2)
+            dst.set_band_description(1, "max_depth")
+            dst.set_band_description(2, "mean_depth")
+            dst.update_tags(bins=len(state["bins"]))
+        logging.info("generated: " + composite_tiff)
+
+    # daily maxima per watershed, accumulated with the bins
+    daily_max = pd.DataFrame(
+        state["summary_max"],
+        index=pd.Index(state["pfaf_id"], name="pfaf_id"),
+        columns=GFMS_DAILY_FIELDS,
+    )
+    if duration_max is not None:
+        daily_max["GFMS_Duration"] = duration_max.reindex(daily_max.index)
+    daily_csv = os.path.join(
+        settings.GFMS_SUM_DIR, f"Flood_byStor_{real_date}_dailymax.csv"
+    )
+    daily_max.to_csv(daily_csv)
+    catalog.register(daily_csv)
+    logging.info("generated: " + daily_csv)
+
+    return
+
+
+def GFMS_archive(real_date):
+    """zip the processed GFMS data of a date and remove the files"""
+
+    date_files = glob.glob(
+        os.path.join(settings.GFMS_PROC_DIR, f"Flood_byStor_{real_date}*.*")
+    )
+    if len(date_files) == 0:
+        # already archived
+        return
+
+    zipped = os.path.join(settings.GFMS_PROC_DIR, f"gfms_{real_date}.zip")
+
+    # os-agnostic process
+    # a part of the date may be archived already: the archive is rewritten,
+    # the files of this run replace the archived ones of the same name
+    names = {os.path.basename(f) for f in date_files}
+    with zipfile.ZipFile(zipped + ".tmp", "w") as z:
+        if os.path.exists(zipped):
+            with zipfile.ZipFile(zipped) as archived:
+                for info in archived.infolist():
+                    if info.filename not in names:
+                        z.writestr(info, archived.read(info))
+        for f in date_files:
+            z.write(f, arcname=os.path.basename(f))  # match shell zip behavior
+    os.replace(zipped + ".tmp", zipped)
+
+    logging.info("generated: " + zipped)
+
+    # remove all the files
+    for filePath in date_files:
+        try:
+            os.remove(filePath)
+        except:
+            logging.warning("Error while deleting file : " + filePath)
+
+    return
+
+
+def GFMS_incremental(days=1):
+    """process GFMS bins as soon as they are published
+
+    -- polls the bins of the previous days and today, independent of GloFAS
+    -- duration is fixed for the bins available in sequence
+    -- flood_severity runs once the matching GloFAS file is processed,
+       otherwise it is left to GFMS_cron when the GloFAS file lands
+    """
+
+    today = datetime.now(timezone.utc)
+    for delta in range(days, -1, -1):
+        bin_date = (today - timedelta(days=delta)).strftime("%Y%m%d")
+        with _date_lock(bin_date) as locked:
+            if locked:
+                _GFMS_incremental_date(bin_date)
+
+    return
+
+
+def _GFMS_incremental_date(bin_date):
+    """process the published bins of a date, then the date once complete"""
+
+    binhours = ["00", "03", "06", "09", "12", "15", "18", "21"]
+
+    # the bins in sequence, stop at the first one not published yet
+    fix_list = []
+    for binhour in binhours:
+        bin_file = "Flood_byStor_" + bin_date + binhour + ".bin"
+        bin_csv = bin_file.replace(".bin", ".csv")
+        if not (
+            os.path.exists(os.path.join(settings.GFMS_SUM_DIR, bin_csv))
+            or os.path.exists(os.path.join(settings.GFMS_PROC_DIR, bin_csv))
+        ):
+            if not GFMS_bin_online(bin_file):
+                break
+            GFMS_data_extractor(bin_file)
+            if not os.path.exists(os.path.join(settings.GFMS_PROC_DIR, bin_csv)):
+                # failed download or extraction, try on the next run
+                break
+        fix_list.append(bin_csv)
+
+    # duration caculation, the previous day 21 hour is the base
+    previous_date = datetime.strptime(bin_date, "%Y%m%d") - timedelta(days=1)
+    base0 = "Flood_byStor_" + previous_date.strftime("%Y%m%d") + "21.csv"
+    duration_max = GFMS_fix_duration(base0, fix_list)
+
+    # wait for the remaining bins of the date
+    if len(fix_list) < len(binhours):
+        return
+
+    # flood severity only with the matching GloFAS data
+    gfmscsv = os.path.join(settings.GFMS_SUM_DIR, "Flood_byStor_" + bin_date + "00.csv")
+    glofascsv = os.path.join(settings.GLOFAS_DIR, "threspoints_" + bin_date + "00.csv")
+    if os.path.exists(glofascsv):
+        flood_severity(gfmscsv, glofascsv, bin_date)
+    else:
+        logging.info("waiting for GloFAS: " + bin_date)
+
+    GFMS_daily_products(bin_date, duration_max)
+    GFMS_archive(bin_date)
 
     return
 
@@ -625,6 +1262,8 @@ def GFMS_cron():
 
     # process GloFAS data
     processing_dates = GloFAS_process()
+    if len(processing_dates) == 0:
+        return
     # process GFMS data
     # processing_dates = ['2021120200']
     GFMS_processing(processing_dates)
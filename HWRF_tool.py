@@ -3,14 +3,13 @@ HWRF_tool.py
     -- cron job script for HWRF data
 """
 
-import csv
 import json
 import logging
 import math
 import os
 import shutil
-import subprocess
 import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone
 
 import geopandas as gpd
@@ -18,12 +17,15 @@ import numpy as np
 import pandas as pd
 import rasterio
 import requests
-from bs4 import BeautifulSoup
-from osgeo import gdal
 from rasterio import Affine
+from rasterio.io import MemoryFile
 from rasterio.mask import mask
+from rasterio.transform import array_bounds
 from shapely.geometry import Point
 
+import catalog
+import listing_cache
+import rain_total
 import settings
 from HWRF_MoM import hwrf_workflow
 from utilities import get_current_processing_datehour, hwrf_today, watersheds_gdb_reader
@@ -32,16 +34,14 @@ from utilities import get_current_processing_datehour, hwrf_today, watersheds_gd
 def check_status(adate):
     """check if a give date is processed"""
 
-    processed_list = os.listdir(settings.HWRF_SUM_DIR)
-    processed = any(adate in x for x in processed_list)
+    datestr, hourstr = adate[:-2], adate[-2:]
+    processed = catalog.exists("HWRF", "summary", datestr, hourstr)
 
     if processed:
         return processed
 
     # extra check
-    processed_list = os.listdir(settings.HWRF_PROC_DIR)
-    zipped_list = [x for x in processed_list if "zip" in x]
-    processed = any(adate in x for x in zipped_list)
+    processed = catalog.exists("HWRF", "raw", datestr, hourstr)
 
     return processed
 
@@ -61,24 +61,18 @@ def check_hours(adate):
 
 
 def generate_procesing_list():
-    """generate the processing list"""
+    """generate the processing list
+    return a dict object, the url of the cycles to process
+    {'2022071200': 'https://ftpprd.ncep.noaa.gov/data/nccf/com/hwrf/prod/hwrf.20220712/00/'}
+    """
 
     hosturl = settings.config.get("hwrf", "HOST")
 
-    # Check if the host URL is accessible
-    from utilities import url_exits
-
-    if not url_exits(hosturl):
-        logging.info(f"Host URL {hosturl} is not accessible")
-        return {}  # Return an empty dictionary if URL isn't reachable
-
     try:
-        reqs = requests.get(hosturl)
-        soup = BeautifulSoup(reqs.text, "html.parser")
+        [links, changed] = listing_cache.listing(hosturl)
 
         datelist = {}
-        for link in soup.find_all("a"):
-            fstr = link.string
+        for fstr in links:
             if fstr[:5] == "hwrf.":
                 a_entry = fstr.split(".")[1]
                 a_entry = a_entry.replace("/", "")
@@ -89,12 +83,19 @@ def generate_procesing_list():
         # extract second level
 
         dataurllist = {}
+        # the date folders are listed again only if the root has changed, the
+        # latest date folder still gets new cycles
+        latest = max(datelist, default="")
         for key in datelist.keys():
             hosturl = datelist[key]
-            reqs = requests.get(hosturl)
-            soup = BeautifulSoup(reqs.text, "html.parser")
-            for link in soup.find_all("a"):
-                fstr = link.string
+            try:
+                [links, _] = listing_cache.listing(
+                    hosturl, refresh=changed or key == latest
+                )
+            except requests.exceptions.RequestException as e:
+                logging.warning(f"Error accessing {hosturl}: {e}")
+                continue
+            for fstr in links:
                 hhstr = fstr.replace("/", "")
                 if hhstr in ["00", "06", "12", "18"]:
                     a_entry = key + hhstr
@@ -103,6 +104,7 @@ def generate_procesing_list():
                     # check if it is too early to process the data
                     if check_hours(a_entry):
                         continue
+                    dataurllist[a_entry] = hosturl + fstr
 
         return dataurllist
 
@@ -111,138 +113,201 @@ def generate_procesing_list():
         return {}  # Return an empty dictionary
 
 
+# timeout of the HWRF requests, seconds
+HWRF_TIMEOUT = 60
+
+
+def _hwrf_fetch(session, url, save_file):
+    """download a file, skipped if the file is there with the size of the
+    remote file
+    -- written to a .part file first, replaced when complete
+    """
+
+    # no compression, the size is the size of the file
+    headers = {"Accept-Encoding": "identity"}
+    if os.path.exists(save_file):
+        r = session.head(
+            url, headers=headers, allow_redirects=True, timeout=HWRF_TIMEOUT
+        )
+        size = r.headers.get("Content-Length")
+        if r.ok and size is not None and int(size) == os.path.getsize(save_file):
+            return
+
+    part_file = save_file + ".part"
+    with session.get(url, headers=headers, stream=True, timeout=HWRF_TIMEOUT) as r:
+        r.raise_for_status()
+        size = r.headers.get("Content-Length")
+        with open(part_file, "wb") as f:
+            for chunk in r.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+    if size is not None and int(size) != os.path.getsize(part_file):
+        os.remove(part_file)
+        raise IOError(f"incomplete download {url}: {size} bytes expected")
+    os.replace(part_file, save_file)
+
+
 def HWRF_download(hwrfurl):
-    """download rainfall data"""
-    reqs = requests.get(hwrfurl)
-    soup = BeautifulSoup(reqs.text, "html.parser")
-
-    ascii_list = []
-    for link in soup.find_all("a"):
-        fstr = link.string
-        if "rainfall.ascii" in fstr:
-            fstr_local = os.path.join(settings.HWRF_PROC_DIR, fstr)
-            if not os.path.exists(fstr_local):
-                subprocess.run(
-                    [
-                        "wget",
-                        f"{hwrfurl.rstrip('/')}/{fstr}",
-                        "-P",
-                        settings.HWRF_PROC_DIR,
-                    ],
-                    check=True,
-                )  # Raises CalledProcessError on non-zero exit
-            ascii_list.append(fstr)
+    """download rainfall data
+    -- the rainfall.ascii files are downloaded in DOWNLOADS threads on a
+       shared session
+    -- raise requests.exceptions.RequestException or IOError if a file is not
+       downloaded
+    """
+    [links, _] = listing_cache.listing(hwrfurl)
+
+    ascii_list = [x for x in links if "rainfall.ascii" in x]
+    if len(ascii_list) == 0:
+        return ascii_list
+
+    workers = settings.config.getint("hwrf", "DOWNLOADS", fallback=4)
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            jobs = [
+                executor.submit(
+                    _hwrf_fetch,
+                    session,
+                    f"{hwrfurl.rstrip('/')}/{fstr}",
+                    os.path.join(settings.HWRF_PROC_DIR, fstr),
+                )
+                for fstr in ascii_list
+            ]
+            # raise the first error
+            for job in jobs:
+                job.result()
 
     return ascii_list
 
 
-def process_rain(adate, TC_Rain):
-    """process rainfall data"""
-
-    ## VRT template to read the csv
-    vrt_template = """<OGRVRTDataSource>
-        <OGRVRTLayer name='{}'>
-            <SrcDataSource>{}</SrcDataSource>
-            <GeometryType>wkbPoint</GeometryType>
-            <GeometryField encoding="PointFromColumns" x="lon" y="lat" z="Z"/>
-        </OGRVRTLayer>
-    </OGRVRTDataSource>"""
-
-    ## Read each text file and create the separate tiff file
-    for i in TC_Rain:
-        with open(i, "r") as f:
-            variable = csv.reader(f, delimiter=" ")
-            row_count = 1
-            for row in variable:
-                if row_count == 1:
-                    while "" in row:
-                        row.remove("")
-                    XLC = float(row[0])
-                    XRC = float(row[1])
-                    YBC = float(row[2])
-                    YTC = float(row[3])
-                    res = float(row[4])
-                    nrows = float(row[5])
-                    ncol = float(row[6])
-                    row_count = row_count + 1
-        df = (
-            pd.read_table(
-                i, skiprows=1, delim_whitespace=True, names=("lat", "lon", "Z")
-            )
-        ).fillna(-999)
-        df.sort_values(by=["lat", "lon"], ascending=[False, True])
-        df = df[["lon", "lat", "Z"]]
-        df = df[df.lon >= XLC]
-        df = df[df.lon <= XRC]
-        df = df[df.lat >= YBC]
-        df = df[df.lat <= YTC]
-        df = df[df.Z > 0]
-        df.to_csv(i.replace(".ascii", ".csv"), index=False, sep=" ")
-        with open(i.replace(".ascii", ".vrt"), "w") as g:
-            g.write(
-                vrt_template.format(
-                    i.replace(".ascii", ""), i.replace(".ascii", ".csv")
-                )
-            )
-        g.close()
-        r = gdal.Rasterize(
-            i.replace(".ascii", ".tiff"),
-            i.replace(".ascii", ".vrt"),
-            outputSRS="EPSG:4326",
-            xRes=res,
-            yRes=res,
-            attribute="Z",
-            noData=-999,
-        )
-        r = None
-        os.remove(i.replace(".ascii", ".csv"))
+# no data value of the rainfall grid
+RAIN_NODATA = -999
 
-    ##merge all  tiffs file als
-    # nd delete the individual tiff, vrt and ascii file
 
-    TC_Rain_tiff = []
-    for i in TC_Rain:
-        TC_Rain_tiff.append(i.replace(".ascii", ".tiff"))
+def read_rain_ascii(ascii_file):
+    """rainfall points of a storm
+    -- header: XLC XRC YBC YTC res nrows ncol, the corner cells of the grid
+    -- rows: lat lon rainfall, the points outside the grid or without rainfall
+       are dropped
+    return [header, lon, lat, rain]
+    """
 
-    filename = "hwrf." + adate + "rainfall.vrt"
-    raintiff = filename.replace(".vrt", ".tiff")
-    vrt = gdal.BuildVRT(filename, TC_Rain_tiff)
-    gdal.Translate(raintiff, vrt)
-    vrt = None
+    with open(ascii_file, "r") as f:
+        header = [float(x) for x in f.readline().split()]
+        try:
+            points = pd.read_csv(
+                f, sep=r"\s+", header=None, names=["lat", "lon", "Z"]
+            ).to_numpy(dtype=np.float64)
+        except pd.errors.EmptyDataError:
+            points = np.empty((0, 3))
+    XLC, XRC, YBC, YTC = header[:4]
+    lat, lon, rain = points.T
+    valid = (lon >= XLC) & (lon <= XRC) & (lat >= YBC) & (lat <= YTC) & (rain > 0)
+
+    return [header, lon[valid], lat[valid], rain[valid]]
+
+
+def grid_origin(storms):
+    """[west, north, res] of the grid of all the storms, the cells are centred
+    on the grid points of the headers
+    """
+
+    res = storms[0][0][4]
+    west = min(x[0][0] for x in storms) - res / 2
+    north = max(x[0][3] for x in storms) + res / 2
+
+    return [west, north, res]
+
+
+def mosaic_rain(storms, origin=None):
+    """place the storm rainfall on one grid
+    -- the grid covers the given storms, on the cells of origin (default: the
+       grid of the given storms)
+    -- where storms overlap, the highest rainfall is kept
+    return [grid, transform]
+    """
+
+    if origin is None:
+        origin = grid_origin(storms)
+    [west, north, res] = origin
+    # window of the storms in the cells of origin
+    col0 = int(round((min(x[0][0] for x in storms) - res / 2 - west) / res))
+    col1 = int(round((max(x[0][1] for x in storms) + res / 2 - west) / res))
+    row0 = int(round((north - max(x[0][3] for x in storms) - res / 2) / res))
+    row1 = int(round((north - min(x[0][2] for x in storms) + res / 2) / res))
+    west = west + col0 * res
+    north = north - row0 * res
+    ncols = col1 - col0
+    nrows = row1 - row0
+
+    # no data is below any rainfall
+    grid = np.full((nrows, ncols), RAIN_NODATA, dtype=np.float64)
+    for _, lon, lat, rain in storms:
+        col = np.floor((lon - west) / res).astype(int)
+        row = np.floor((north - lat) / res).astype(int)
+        inside = (col >= 0) & (col < ncols) & (row >= 0) & (row < nrows)
+        np.maximum.at(grid, (row[inside], col[inside]), rain[inside])
+
+    return [grid, Affine(res, 0, west, 0, -res, north)]
+
+
+def rain_profile(grid, transform):
+    """rasterio profile of the rainfall grid"""
+
+    return {
+        "driver": "GTiff",
+        "height": grid.shape[0],
+        "width": grid.shape[1],
+        "count": 1,
+        "dtype": grid.dtype,
+        "crs": "EPSG:4326",
+        "transform": transform,
+        "nodata": RAIN_NODATA,
+    }
 
-    # no need
-    # gdalcmd = "gdal_translate -of GTiff " + filename + " " + raintiff
-    # subprocess.call(gdalcmd, shell=True)
+
+def process_rain(adate, TC_Rain):
+    """process rainfall data
+    -- each storm is placed on its own domain of the grid of all the storms
+    -- hwrf.YYYYMMDDHHrainfall.tiff, the mosaic of the storms, is written as
+       the product
+    return [raintiff, [[grid, transform] of each storm]]
+    """
+
+    storms = [read_rain_ascii(i) for i in TC_Rain]
+    origin = grid_origin(storms)
+    [grid, transform] = mosaic_rain(storms, origin)
+
+    raintiff = "hwrf." + adate + "rainfall.tiff"
+    with rasterio.open(raintiff, "w", **rain_profile(grid, transform)) as dst:
+        dst.write(grid, 1)
 
     # create a zipfile
     zip_file = "hwrf." + adate + "rainfall.zip"
     with zipfile.ZipFile(zip_file, "w", zipfile.ZIP_DEFLATED) as zipObj:
-        for i in TC_Rain_tiff:
-            asfile = i.replace(".tiff", ".ascii")
-            zipObj.write(asfile)
+        for i in TC_Rain:
+            zipObj.write(i)
+    catalog.register(zip_file)
 
-    for i in TC_Rain_tiff:
+    for i in TC_Rain:
         os.remove(i)
-        os.remove(i.replace(".tiff", ".ascii"))
-        os.remove(i.replace(".tiff", ".vrt"))
 
-    return raintiff
+    return [raintiff, [mosaic_rain([x], origin) for x in storms]]
 
 
-def HWRF_extract_by_mask(mask_json, tiff):
-    """extract by each watershed"""
+def HWRF_extract_by_mask(mask_json, src):
+    """extract by each watershed, src: the rainfall grid as an open dataset"""
 
-    with rasterio.open(tiff) as src:
-        try:
-            out_image, out_transform = mask(
-                src, [mask_json["features"][0]["geometry"]], crop=True
-            )
-        except ValueError as e:
-            #'Input shapes do not overlap raster.'
-            # print(e)
-            src = None
-            # return empty dataframe
-            return pd.DataFrame()
+    try:
+        out_image, out_transform = mask(
+            src, [mask_json["features"][0]["geometry"]], crop=True
+        )
+    except ValueError as e:
+        #'Input shapes do not overlap raster.'
+        # print(e)
+        # return empty dataframe
+        return pd.DataFrame()
 
     # extract data
     no_data = src.nodata
@@ -253,7 +318,6 @@ def HWRF_extract_by_mask(mask_json, tiff):
     row, col = np.where(data != no_data)
     point_value = np.extract(data != no_data, data)
     if len(point_value) == 0:
-        src = None
         # return empty dataframe
         return pd.DataFrame()
 
@@ -273,68 +337,95 @@ def HWRF_extract_by_mask(mask_json, tiff):
     # geometry
     d["geometry"] = d.apply(lambda row: Point(row["lon"], row["lat"]), axis=1)
     # first 2 points
-    src = None
     return d
 
 
-def HWRF_extract_by_watershed(raintiff):
-    """extract flood info by watershed"""
-
-    ## zonal analysis using merged tiff and watersheds
-    watersheds = watersheds_gdb_reader()
-    pfafid_list = watersheds.index.tolist()
-
-    headers_list = [
-        "pfaf_id",
-        "Rain_TotalArea_km",
-        "perc_Area",
-        "MeanRain",
-        "MaxRain",
-    ]
-    output_csv = raintiff.replace(".tiff", ".csv")
-    with open(output_csv, "w") as f:
-        writer = csv.writer(f)
-        writer.writerow(headers_list)
-    has_data = False
-    with open(output_csv, "a") as f:
-        writer = csv.writer(f)
-        for the_pfafid in pfafid_list:
-            test_json = json.loads(
-                gpd.GeoSeries([watersheds.loc[the_pfafid, "geometry"]]).to_json()
-            )
+def HWRF_extract_storm(grid, transform, geometries):
+    """rainfall points of the watersheds in the domain of a storm
+    return dataframe: pfaf_id, lon, lat, intensity, area
+    """
+
+    columns = ["pfaf_id", "lon", "lat", "intensity", "area"]
+    points = []
+    with (
+        MemoryFile() as memfile,
+        memfile.open(**rain_profile(grid, transform)) as src,
+    ):
+        src.write(grid, 1)
+        for the_pfafid, geometry in geometries.items():
+            test_json = json.loads(gpd.GeoSeries([geometry]).to_json())
             if test_json["features"][0]["geometry"] == None:
                 continue
-            data_points = HWRF_extract_by_mask(test_json, raintiff)
-            # write summary to a csv file
+            data_points = HWRF_extract_by_mask(test_json, src)
             if not data_points.empty:
-                HWRF_TotalArea_km = data_points["area"].sum()
-                HWRF_perc_Area = (
-                    HWRF_TotalArea_km / watersheds.loc[the_pfafid]["area_km2"] * 100
-                )
-                HWRF_MeanRain = data_points["intensity"].mean()
-                HWRF_MaxRain = data_points["intensity"].max()
-                results_list = [
-                    the_pfafid,
-                    HWRF_TotalArea_km,
-                    HWRF_perc_Area,
-                    HWRF_MeanRain,
-                    HWRF_MaxRain,
-                ]
-                writer.writerow(results_list)
-                has_data = True
+                data_points["pfaf_id"] = the_pfafid
+                points.append(pd.DataFrame(data_points[columns]))
+    if len(points) == 0:
+        return pd.DataFrame(columns=columns)
+
+    return pd.concat(points, ignore_index=True)
+
+
+def fuse_storm_points(points):
+    """rainfall points of the storms by watershed
+    -- overlap rule: where storms overlap, a cell is counted once with the
+       highest rainfall of the storms, as in the product mosaic
+    """
+
+    # the storm grids share the cells, the cell centres match up to rounding
+    cell = [points["pfaf_id"], points["lon"].round(6), points["lat"].round(6)]
+
+    return points.groupby(cell).agg({"intensity": "max", "area": "first"})
+
+
+def HWRF_extract_by_watershed(raintiff, storm_grids):
+    """extract flood info by watershed
+    return [output_csv, has_data, summary]
+    -- each storm is extracted over the watersheds of its domain, the storms
+       run in parallel in EXTRACT_WORKERS processes
+    -- the storm results are fused by fuse_storm_points
+    """
+
+    ## zonal analysis using the storm grids and watersheds
+    watersheds = watersheds_gdb_reader()
+    workers = settings.config.getint("hwrf", "EXTRACT_WORKERS", fallback=2)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = []
+        for grid, transform in storm_grids:
+            west, south, east, north = array_bounds(*grid.shape, transform)
+            geometries = watersheds.cx[west:east, south:north].geometry
+            jobs.append(
+                executor.submit(HWRF_extract_storm, grid, transform, geometries)
+            )
+        points = [x.result() for x in jobs]
+    points = pd.concat([x for x in points if not x.empty] or points)
+
+    cells = fuse_storm_points(points)
+    summary = cells.groupby(level="pfaf_id").agg(
+        Rain_TotalArea_km=("area", "sum"),
+        MeanRain=("intensity", "mean"),
+        MaxRain=("intensity", "max"),
+    )
+    # in the order of the watersheds
+    summary = summary.reindex(watersheds.index[watersheds.index.isin(summary.index)])
+    summary["perc_Area"] = (
+        summary["Rain_TotalArea_km"] / watersheds.loc[summary.index, "area_km2"] * 100
+    )
+    summary = summary[["Rain_TotalArea_km", "perc_Area", "MeanRain", "MaxRain"]]
+
+    output_csv = raintiff.replace(".tiff", ".csv")
+    has_data = not summary.empty
     # has_data, move file to the right locaition
     # no_data, delete all the file
     if has_data:
-        shutil.move(output_csv, os.path.join(settings.HWRF_SUM_DIR, output_csv))
+        summary.to_csv(os.path.join(settings.HWRF_SUM_DIR, output_csv))
+        catalog.register(os.path.join(settings.HWRF_SUM_DIR, output_csv))
         shutil.move(raintiff, os.path.join(settings.HWRF_IMG_DIR, raintiff))
-        os.remove(raintiff.replace(".tiff", ".vrt"))
     else:
         os.remove(raintiff)
-        os.remove(output_csv)
-        os.remove(raintiff.replace(".tiff", ".vrt"))
         logging.info("no data: " + output_csv)
 
-    return [output_csv, has_data]
+    return [output_csv, has_data, summary]
 
 
 def HWRF_cron():
@@ -365,19 +456,26 @@ def HWRF_cron():
     # download - process ascii
     for key in datelist:
         logging.info("check: " + key)
-        a_list = HWRF_download(datelist[key])
+        # a cycle not downloaded is retried on the next run
+        try:
+            a_list = HWRF_download(datelist[key])
+        except (requests.exceptions.RequestException, IOError) as e:
+            logging.warning(f"download failed {key}: {e}")
+            continue
         if len(a_list) == 0:
             logging.info("no rainfall data " + key)
             continue
         logging.info("processing " + key)
-        newtiff = process_rain(key, a_list)
+        [newtiff, storm_grids] = process_rain(key, a_list)
         logging.info("processing " + newtiff)
-        [hwrfcsv, dataflag] = HWRF_extract_by_watershed(newtiff)
+        [hwrfcsv, dataflag, summary] = HWRF_extract_by_watershed(newtiff, storm_grids)
         if not dataflag:
             logging.info("no data, not generated: " + hwrfcsv)
             # if no csv produced, it shall just conitune to produce MoM output
             # continue
         logging.info("generated: " + hwrfcsv)
+        # running storm totals, from the zonal stats in memory
+        rain_total.update(key, summary)
 
         # run MoM update
         testdate = key
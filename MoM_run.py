@@ -32,9 +32,13 @@ if os.name == "nt":
     installers_path = os.path.join(current_dir, "first_setup")
     os.environ["PATH"] = installers_path + os.pathsep + os.environ["PATH"]
 
+import alert_state
+import catalog
+import GFMS_cube
+import rain_total
 from DFO_MoM import batchrun_DFO_MoM
-from DFO_tool import DFO_cron
-from GFMS_tool import GFMS_cron, GFMS_fixdate
+from DFO_tool import DFO_check, DFO_cron
+from GFMS_tool import GFMS_cron, GFMS_fixdate, GFMS_incremental
 from HWRF_MoM import batchrun_HWRF_MoM
 from HWRF_tool import HWRF_cron
 from VIIRS_MoM import batchrun_VIIRS_MoM
@@ -52,7 +56,21 @@ def _getParser():
         epilog=epilog,
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
-    joblist = ["GFMS", "HWRF", "HWRF_MOM", "DFO", "DFO_MOM", "VIIRS", "VIIRS_MOM"]
+    joblist = [
+        "GFMS",
+        "GFMS_BIN",
+        "HWRF",
+        "HWRF_MOM",
+        "DFO",
+        "DFO_MOM",
+        "DFO_CHECK",
+        "VIIRS",
+        "VIIRS_MOM",
+        "CATALOG",
+        "ALERT_STATE",
+        "RAINTOTAL",
+        "GFMS_CUBE",
+    ]
     parser.add_argument(
         "-j",
         "--job",
@@ -81,6 +99,8 @@ def run_job(cronjob):
     print("Main PID:", os.getpid())
     if cronjob == "GFMS":
         GFMS_cron()
+    elif cronjob == "GFMS_BIN":
+        GFMS_incremental()
     elif cronjob == "HWRF":
         HWRF_cron()
         batchrun_HWRF_MoM()
@@ -90,6 +110,18 @@ def run_job(cronjob):
     elif cronjob == "VIIRS":
         VIIRS_cron()
         batchrun_VIIRS_MoM()
+    elif cronjob == "CATALOG":
+        # rebuild the product catalog from the product folders
+        catalog.rebuild()
+    elif cronjob == "ALERT_STATE":
+        # keep the alert levels of the recent HWRF cycles from their MoM outputs
+        alert_state.rebuild()
+    elif cronjob == "RAINTOTAL":
+        # rebuild the storm-total HWRF rainfall from the catalog
+        rain_total.replay()
+    elif cronjob == "GFMS_CUBE":
+        # append the archived GFMS bins missing from the datacube
+        GFMS_cube.backfill(scan=True)
     else:
         return
 
@@ -101,6 +133,12 @@ def run_fixdate(cronjob, adate):
         GFMS_fixdate(adate)
     elif cronjob == "VIIRS":
         VIIRS_cron(adate)
+    elif cronjob == "ALERT_STATE":
+        # from an older date, e.g. before reprocessing it
+        alert_state.rebuild(adate[:8])
+    elif cronjob == "DFO_CHECK":
+        # compare DFO_process with the former per-tile processing, and time both
+        DFO_check(adate)
     else:
         return
 
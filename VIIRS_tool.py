@@ -29,6 +29,7 @@ from multiprocessing import Pool
 from osgeo import gdal
 from rasterio.mask import mask
 
+import catalog
 import settings
 from utilities import read_data, watersheds_gdb_reader
 from VIIRS_MoM import update_VIIRS_MoM
@@ -368,6 +369,7 @@ def VIIRS_extract_by_watershed(adate, tiffs):
         settings.VIIRS_SUM_DIR, "VIIRS_Flood_{}.csv".format(adate)
     )
     merge.to_csv(merged_csv)
+    catalog.register(merged_csv)
     logging.info("generated: " + merged_csv)
 
     # need clean up
@@ -0,0 +1,127 @@
+"""
+alert_state.py
+    -- alert levels of the watersheds by HWRF cycle (YYYYMMDDHH)
+    -- int8 codes on the fixed watershed order: 0 no alert, 1 to 4 Information
+       to Warning, one file of a few kB per cycle in ALERT_STATE_DIR
+    -- the levels are kept when the HWRF+DFO+VIIRS MoM of a cycle is generated,
+       the alert status of a cycle compares with the levels of the day before
+       without reading the MoM output of the day before
+    -- one state per cycle, not a single last level by watershed: the status
+       compares with the cycle a day before, which the cycles run since (every
+       6 hours, or in parallel by the HWRF batch) would have overwritten
+    -- the MoM outputs are read only by rebuild(): on the first use of the
+       state, and by MoM_run.py -j ALERT_STATE [-fd YYYYMMDD] after reprocessing
+       older dates
+"""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+import catalog
+import scoring
+import settings
+import watershed_store
+
+ALERT_STATE_DAYS = 30
+
+
+def _state_file(adate):
+    return os.path.join(settings.ALERT_STATE_DIR, f"alert_{adate}.npy")
+
+
+def _read_state(adate):
+    """levels kept for a cycle, None if not kept with the watershed order"""
+
+    state_file = _state_file(adate)
+    if not os.path.exists(state_file):
+        return None
+    levels = np.load(state_file)
+    if len(levels) != len(watershed_store.watershed_order()):
+        return None
+
+    return levels
+
+
+def _state_dir():
+    """ALERT_STATE_DIR, filled from the MoM outputs on the first use"""
+
+    if not os.path.isdir(settings.ALERT_STATE_DIR):
+        os.makedirs(settings.ALERT_STATE_DIR, exist_ok=True)
+        rebuild()
+
+    return settings.ALERT_STATE_DIR
+
+
+def _prune_state():
+    """remove the levels kept for more than ALERT_STATE_DAYS"""
+
+    expired = time.time() - ALERT_STATE_DAYS * 86400
+    for name in os.listdir(settings.ALERT_STATE_DIR):
+        state_file = os.path.join(settings.ALERT_STATE_DIR, name)
+        if os.path.getmtime(state_file) < expired:
+            os.remove(state_file)
+
+
+def record(adate, pfaf_id, alerts):
+    """keep the alert levels of a cycle, return the levels"""
+
+    order = watershed_store.watershed_order()
+    position = order.get_indexer(pfaf_id)
+    known = position >= 0
+    levels = np.zeros(len(order), dtype=np.int8)
+    levels[position[known]] = scoring.alert_codes(alerts)[known]
+
+    _state_dir()
+    # several jobs may write the same cycle
+    state_file = _state_file(adate)
+    tmp_file = f"{state_file}.{os.getpid()}.part"
+    with open(tmp_file, "wb") as f:
+        np.save(f, levels)
+    os.replace(tmp_file, state_file)
+    _prune_state()
+
+    return levels
+
+
+def rebuild(start=None):
+    """keep the levels of the cycles not kept yet, read from their MoM outputs
+    -- the cycles from start (YYYYMMDD), the last ALERT_STATE_DAYS by default
+    """
+
+    if start is None:
+        start = datetime.now(timezone.utc) - timedelta(days=ALERT_STATE_DAYS)
+        start = start.strftime("%Y%m%d")
+    mom_list = catalog.products("HWRF+DFO+VIIRS", "mom", start=start)
+    for date, hour, mom in mom_list:
+        if _read_state(date + hour) is not None:
+            continue
+        df = pd.read_csv(mom, usecols=["pfaf_id", "Alert"])
+        record(date + hour, df["pfaf_id"], df["Alert"])
+
+
+def load(adate):
+    """alert levels of a cycle, None if they are not kept"""
+
+    _state_dir()
+
+    return _read_state(adate)
+
+
+def previous(adate):
+    """alert levels of the cycle a day before, None if not found"""
+
+    day_before = datetime.strptime(adate, "%Y%m%d%H") - timedelta(days=1)
+
+    return load(day_before.strftime("%Y%m%d%H"))
+
+
+def lookup(levels, pfaf_id):
+    """alert levels of the watersheds, 0 for a watershed not in the order"""
+
+    position = watershed_store.watershed_order().get_indexer(pfaf_id)
+
+    return np.where(position >= 0, levels[position], 0).astype(np.int8)
@@ -0,0 +1,301 @@
+"""
+catalog.py
+    -- catalog of the products in a SQLite database (CATALOG_DB)
+    -- one row per product file: source, kind, date YYYYMMDD, hour HH ("" for
+       the daily products) and path, indexed by (source, kind, date, hour)
+    -- a product is registered when it is written, the latest/processed/paired
+       products are found with index queries instead of folder scans
+    -- the catalog is filled from the product folders when it is created,
+       rebuild() scans the folders again: MoM_run.py -j CATALOG
+"""
+
+import contextlib
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+import settings
+
+# source, kind, folder, file name with the date and hour
+PRODUCTS = [
+    ("GloFAS", "summary", settings.GLOFAS_DIR, r"threspoints_(\d{8})(\d{2})\.csv"),
+    ("GFMS", "summary", settings.GFMS_SUM_DIR, r"Flood_byStor_(\d{8})(\d{2})\.csv"),
+    (
+        "GFMS",
+        "dailymax",
+        settings.GFMS_SUM_DIR,
+        r"Flood_byStor_(\d{8})_dailymax\.csv",
+    ),
+    ("GFMS", "mom", settings.GFMS_MOM_DIR, r"Final_Attributes_(\d{8})\.csv"),
+    ("GFMS", "clean", settings.GFMS_MOM_DIR, r"Attributes_Clean_(\d{8})\.csv"),
+    ("HWRF", "raw", settings.HWRF_PROC_DIR, r"hwrf\.(\d{8})(\d{2})rainfall\.zip"),
+    ("HWRF", "summary", settings.HWRF_SUM_DIR, r"hwrf\.(\d{8})(\d{2})rainfall\.csv"),
+    (
+        "HWRF",
+        "total",
+        settings.HWRF_TOTAL_DIR,
+        r"hwrf\.(\d{8})(\d{2})rainfall_total\.csv",
+    ),
+    (
+        "HWRF",
+        "mom",
+        settings.HWRF_MOM_DIR,
+        r"Final_Attributes_(\d{8})(\d{2})HWRFUpdated\.csv",
+    ),
+    (
+        "HWRF",
+        "clean",
+        settings.HWRF_MOM_DIR,
+        r"Attributes_Clean_(\d{8})(\d{2})HWRFUpdated\.csv",
+    ),
+    (
+        "HWRF+DFO+VIIRS",
+        "mom",
+        settings.HWRF_MOM_DIR,
+        r"Final_Attributes_(\d{8})(\d{2})HWRF\+\d{8}DFO\+\d{8}VIIRSUpdated\.csv",
+    ),
+    (
+        "HWRF+DFO+VIIRS",
+        "clean",
+        settings.HWRF_MOM_DIR,
+        r"Attributes_clean_(\d{8})(\d{2})HWRF\+\d{8}DFO\+\d{8}VIIRSUpdated\.csv",
+    ),
+    ("DFO", "summary", settings.DFO_SUM_DIR, r"DFO_(\d{8})\.csv"),
+    (
+        "DFO",
+        "mom",
+        settings.DFO_MOM_DIR,
+        r"Final_Attributes_(\d{8})(\d{2})MOM\+DFOUpdated\.csv",
+    ),
+    (
+        "DFO",
+        "clean",
+        settings.DFO_MOM_DIR,
+        r"Attributes_Clean_(\d{8})(\d{2})MOM\+DFOUpdated\.csv",
+    ),
+    ("VIIRS", "summary", settings.VIIRS_SUM_DIR, r"VIIRS_Flood_(\d{8})\.csv"),
+    (
+        "VIIRS",
+        "mom",
+        settings.VIIRS_MOM_DIR,
+        r"Final_Attributes_(\d{8})(\d{2})MOM\+DFO\+VIIRSUpdated\.csv",
+    ),
+    (
+        "VIIRS",
+        "clean",
+        settings.VIIRS_MOM_DIR,
+        r"Attributes_clean_(\d{8})(\d{2})MOM\+DFO\+VIIRSUpdated\.csv",
+    ),
+    (
+        "FINAL",
+        "alert",
+        settings.FINAL_MOM_DIR,
+        r"Final_Attributes_(\d{8})(\d{2})HWRF\+MOM\+DFO\+VIIRSUpdated_PDC\.csv",
+    ),
+]
+PRODUCTS = [
+    (source, kind, os.path.abspath(folder), re.compile(pattern))
+    for source, kind, folder, pattern in PRODUCTS
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    path TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    date TEXT NOT NULL,
+    hour TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_key ON products (source, kind, date, hour);
+"""
+
+
+def parse(path):
+    """(source, kind, date, hour, path) of a product file, None if the file is
+    not a product
+    """
+
+    folder, name = os.path.split(os.path.abspath(path))
+    for source, kind, product_dir, pattern in PRODUCTS:
+        match = pattern.fullmatch(name)
+        if match and folder == product_dir:
+            date, hour = (match.groups() + ("",))[:2]
+            return source, kind, date, hour, os.path.join(folder, name)
+
+    return None
+
+
+def scan():
+    """products in the product folders, each folder is listed once"""
+
+    folders = sorted({folder for _, _, folder, _ in PRODUCTS})
+    for folder in folders:
+        if not os.path.isdir(folder):
+            continue
+        for entry in os.scandir(folder):
+            product = parse(entry.path)
+            if product is not None:
+                yield product
+
+
+def _fill(conn):
+    """replace the rows with the products on disk, in one transaction"""
+
+    with conn:
+        conn.execute("DELETE FROM products")
+        conn.executemany(
+            "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?)",
+            [
+                (path, source, kind, date, hour)
+                for source, kind, date, hour, path in scan()
+            ],
+        )
+    count = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+    logging.info(f"catalog filled: {count} products")
+
+
+def _connect():
+    """connection to the catalog, created and filled on the first use"""
+
+    os.makedirs(os.path.dirname(settings.CATALOG_DB), exist_ok=True)
+    new = not os.path.exists(settings.CATALOG_DB)
+    # several jobs may write at the same time
+    conn = sqlite3.connect(settings.CATALOG_DB, timeout=60)
+    conn.executescript(SCHEMA)
+    if new:
+        _fill(conn)
+
+    return conn
+
+
+@contextlib.contextmanager
+def _connection():
+    """connection in a transaction, closed at the end"""
+
+    with contextlib.closing(_connect()) as conn:
+        with conn:
+            yield conn
+
+
+def rebuild():
+    """catalog from the products on disk"""
+
+    with contextlib.closing(_connect()) as conn:
+        _fill(conn)
+
+
+def register(path):
+    """add a product file to the catalog, after the file is written"""
+
+    product = parse(path)
+    if product is None:
+        logging.warning("not a catalog product: " + path)
+        return
+
+    source, kind, date, hour, path = product
+    try:
+        with _connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?)",
+                (path, source, kind, date, hour),
+            )
+    except sqlite3.Error as e:
+        # the product is found again by rebuild()
+        logging.warning(f"not registered {path}: {e}")
+
+
+def _products(where, params, order="ASC", limit=None):
+    """(date, hour, path) of the products on disk matching a query
+    -- the rows of removed files are deleted
+    """
+
+    query = (
+        f"SELECT date, hour, path FROM products WHERE {where}"
+        f" ORDER BY date {order}, hour {order}"
+    )
+    found = []
+    removed = []
+    with _connection() as conn:
+        for date, hour, path in conn.execute(query, params):
+            if not os.path.exists(path):
+                removed.append((path,))
+                continue
+            found.append((date, hour, path))
+            if limit is not None and len(found) == limit:
+                break
+        if removed:
+            conn.executemany("DELETE FROM products WHERE path = ?", removed)
+
+    return found
+
+
+def _dates(source, kind, start, end):
+    """query on source, kind and the date range"""
+
+    where = "source = ? AND kind = ?"
+    params = [source, kind]
+    if start is not None:
+        where += " AND date >= ?"
+        params.append(start)
+    if end is not None:
+        where += " AND date <= ?"
+        params.append(end)
+
+    return where, params
+
+
+def find(source, kind, date, hour=""):
+    """path of a product, "" if not found"""
+
+    found = _products(
+        "source = ? AND kind = ? AND date = ? AND hour = ?",
+        [source, kind, date, hour],
+        limit=1,
+    )
+
+    return found[0][2] if found else ""
+
+
+def exists(source, kind, date, hour=None):
+    """a product of the date is found, at the given hour or at any hour"""
+
+    if hour is None:
+        where, params = _dates(source, kind, date, date)
+        return len(_products(where, params, limit=1)) > 0
+
+    return find(source, kind, date, hour) != ""
+
+
+def latest(source, kind, start=None, end=None):
+    """[date, hour, path] of the latest product, dates between start and end
+    (YYYYMMDD, included), ["", "", ""] if not found
+    """
+
+    where, params = _dates(source, kind, start, end)
+    found = _products(where, params, order="DESC", limit=1)
+
+    return list(found[0]) if found else ["", "", ""]
+
+
+def products(source, kind, start=None, end=None, limit=None):
+    """[date, hour, path] of the products in date order, dates between start and
+    end (YYYYMMDD, included), the latest `limit` products if given
+    """
+
+    where, params = _dates(source, kind, start, end)
+    found = _products(where, params, order="DESC", limit=limit)
+
+    return [list(x) for x in reversed(found)]
+
+
+def pair(source, kind, date, hour="", days=1):
+    """[path, path of the same product `days` before], "" if not found"""
+
+    path = find(source, kind, date, hour)
+    if path == "":
+        return ["", ""]
+    before = datetime.strptime(date, "%Y%m%d") - timedelta(days=days)
+
+    return [path, find(source, kind, before.strftime("%Y%m%d"), hour)]
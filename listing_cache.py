@@ -0,0 +1,96 @@
+"""
+listing_cache.py
+    -- cache of the upstream directory listings in LISTING_CACHE
+    -- the ETag/Last-Modified of a page are kept with its links, a page is
+       requested with If-None-Match/If-Modified-Since and a 304 answer uses
+       the cached links
+    -- a child page can be taken from the cache without a request when its
+       parent page is unchanged
+    -- the links are parsed with lxml if installed, html.parser otherwise,
+       only the <a> tags are parsed
+"""
+
+import json
+import logging
+import os
+import time
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
+
+import settings
+
+LISTING_CACHE_DAYS = 30
+LISTING_TIMEOUT = 60
+
+# the fastest parser installed
+PARSER = "lxml" if builder_registry.lookup("lxml") is not None else "html.parser"
+
+
+def _load():
+    if not os.path.exists(settings.LISTING_CACHE):
+        return {}
+    try:
+        with open(settings.LISTING_CACHE) as f:
+            return json.load(f)
+    except ValueError:
+        logging.warning("listing cache is not readable, reset")
+        return {}
+
+
+def _save(cache):
+    """write the cache, the pages not checked for LISTING_CACHE_DAYS are dropped"""
+
+    expired = time.time() - LISTING_CACHE_DAYS * 86400
+    cache = {k: v for k, v in cache.items() if v["checked"] >= expired}
+    os.makedirs(os.path.dirname(settings.LISTING_CACHE), exist_ok=True)
+    # several jobs may write the cache
+    tmp_file = f"{settings.LISTING_CACHE}.{os.getpid()}.part"
+    with open(tmp_file, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_file, settings.LISTING_CACHE)
+
+
+def parse_links(html):
+    """text of the <a> tags of a page"""
+
+    soup = BeautifulSoup(html, PARSER, parse_only=SoupStrainer("a"))
+
+    return [x.string for x in soup.find_all("a") if x.string is not None]
+
+
+def listing(url, refresh=True):
+    """[links of the page, changed]
+    -- refresh False: the cached links are used without a request, if any
+    -- raise requests.exceptions.RequestException if the page is not available
+    """
+
+    cache = _load()
+    entry = cache.get(url)
+    if entry is not None and not refresh:
+        return [entry["links"], False]
+
+    headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    r = requests.get(url, headers=headers, timeout=LISTING_TIMEOUT)
+    if r.status_code == 304 and entry is not None:
+        entry["checked"] = time.time()
+        _save(cache)
+        return [entry["links"], False]
+    r.raise_for_status()
+
+    links = parse_links(r.text)
+    cache[url] = {
+        "etag": r.headers.get("ETag", ""),
+        "last_modified": r.headers.get("Last-Modified", ""),
+        "links": links,
+        "checked": time.time(),
+    }
+    _save(cache)
+
+    return [links, entry is None or entry["links"] != links]
@@ -0,0 +1,201 @@
+"""
+rain_total.py
+    -- running storm-total HWRF rainfall by watershed
+    -- the totals are kept on the fixed watershed order in RAIN_TOTAL_STATE and
+       updated with the zonal stats of each HWRF cycle when they are computed
+    -- MeanRain of a cycle is the rainfall accumulated over the whole forecast
+       of the cycle (the rainfall.ascii swath), the forecasts of the
+       successive cycles overlap and are not summed
+    -- a storm of a watershed: the cycles with rainfall, until no rainfall for
+       STORM_GAP_HOURS; the past rain is the sum of the parts of the forecasts
+       not covered by the next cycle, estimated as the forecast of a cycle
+       minus the forecast of the next cycle (0 if the next forecast is
+       higher); the total adds the forecast of the latest cycle; the peak is
+       the highest MaxRain
+    -- product: hwrf.YYYYMMDDHHrainfall_total.csv in HWRF_TOTAL_DIR, the
+       watersheds with a storm at the cycle
+    -- replay() rebuilds the totals from the HWRF summaries in the catalog:
+       MoM_run.py -j RAINTOTAL
+"""
+
+import logging
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import catalog
+import settings
+import watershed_store
+
+STORM_GAP_HOURS = 48
+
+
+def _hours(adate):
+    """hours since the epoch of a cycle YYYYMMDDHH"""
+
+    cycle = datetime.strptime(adate, "%Y%m%d%H").replace(tzinfo=timezone.utc)
+
+    return int(cycle.timestamp()) // 3600
+
+
+def _cycle(hours):
+    """cycle YYYYMMDDHH of the hours since the epoch"""
+
+    return datetime.fromtimestamp(hours * 3600, timezone.utc).strftime("%Y%m%d%H")
+
+
+def _empty():
+    """totals without any cycle"""
+
+    n = len(watershed_store.watershed_order())
+
+    return {
+        "latest": np.array(-1, dtype=np.int64),
+        "total": np.zeros(n),
+        "forecast": np.zeros(n),
+        "peak": np.zeros(n),
+        "cycles": np.zeros(n, dtype=np.int32),
+        "start": np.full(n, -1, dtype=np.int64),
+        "last": np.full(n, -1, dtype=np.int64),
+    }
+
+
+def load():
+    """totals kept in RAIN_TOTAL_STATE, None if not kept or kept on another
+    watershed order
+    """
+
+    if not os.path.exists(settings.RAIN_TOTAL_STATE):
+        return None
+    with np.load(settings.RAIN_TOTAL_STATE) as f:
+        state = {key: f[key].copy() for key in f.files}
+    if len(state["total"]) != len(watershed_store.watershed_order()):
+        return None
+    # kept by a former version
+    if set(state) != set(_empty()):
+        return None
+
+    return state
+
+
+def _save(state):
+    os.makedirs(os.path.dirname(settings.RAIN_TOTAL_STATE), exist_ok=True)
+    # several jobs may write the totals
+    tmp_file = f"{settings.RAIN_TOTAL_STATE}.{os.getpid()}.part"
+    with open(tmp_file, "wb") as f:
+        np.savez(f, **state)
+    os.replace(tmp_file, settings.RAIN_TOTAL_STATE)
+
+
+def _add(state, adate, summary):
+    """add the zonal stats of a cycle to the totals
+    -- summary: indexed by pfaf_id, MeanRain and MaxRain of the forecast
+    """
+
+    hours = _hours(adate)
+    # the storms ended before the cycle
+    ended = (state["last"] >= 0) & (hours - state["last"] > STORM_GAP_HOURS)
+    state["total"][ended] = 0
+    state["forecast"][ended] = 0
+    state["peak"][ended] = 0
+    state["cycles"][ended] = 0
+    state["start"][ended] = -1
+    state["last"][ended] = -1
+
+    position = watershed_store.watershed_order().get_indexer(summary.index)
+    known = position >= 0
+    position = position[known]
+    rain = np.zeros(len(state["total"]))
+    rain[position] = summary["MeanRain"].to_numpy()[known]
+    # the part of the previous forecast up to this cycle: the rain it forecast
+    # and this cycle does not
+    state["total"] += np.fmax(state["forecast"] - rain, 0)
+    state["forecast"] = rain
+    state["peak"][position] = np.fmax(
+        state["peak"][position], summary["MaxRain"].to_numpy()[known]
+    )
+    state["cycles"][position] += 1
+    state["start"][position] = np.where(
+        state["start"][position] < 0, hours, state["start"][position]
+    )
+    state["last"][position] = hours
+    state["latest"] = np.array(hours, dtype=np.int64)
+
+
+def product(state):
+    """storm totals of the watersheds with a storm at the latest cycle
+    -- Storm_TotalRain: Storm_PastRain + Storm_ForecastRain
+    """
+
+    latest = int(state["latest"])
+    storm = (state["last"] >= 0) & (latest - state["last"] <= STORM_GAP_HOURS)
+    df = pd.DataFrame(
+        {
+            "Storm_TotalRain": state["total"][storm] + state["forecast"][storm],
+            "Storm_PastRain": state["total"][storm],
+            "Storm_ForecastRain": state["forecast"][storm],
+            "Storm_MaxRain": state["peak"][storm],
+            "Storm_Cycles": state["cycles"][storm],
+            "Storm_Start": [_cycle(x) for x in state["start"][storm]],
+            "Storm_Last": [_cycle(x) for x in state["last"][storm]],
+        },
+        index=watershed_store.watershed_order()[storm],
+    )
+
+    return df
+
+
+def _write_product(state):
+    adate = _cycle(int(state["latest"]))
+    os.makedirs(settings.HWRF_TOTAL_DIR, exist_ok=True)
+    total_csv = os.path.join(settings.HWRF_TOTAL_DIR, f"hwrf.{adate}rainfall_total.csv")
+    product(state).to_csv(total_csv)
+    catalog.register(total_csv)
+    logging.info("generated: " + total_csv)
+
+
+def read_summary(hwrf_sum):
+    """MeanRain and MaxRain of an HWRF summary, indexed by pfaf_id"""
+
+    return pd.read_csv(
+        hwrf_sum, usecols=["pfaf_id", "MeanRain", "MaxRain"], index_col="pfaf_id"
+    )
+
+
+def replay(start=None, end=None):
+    """rebuild the totals from the HWRF summaries in the catalog, dates between
+    start and end (YYYYMMDD, included)
+    """
+
+    state = _empty()
+    summaries = catalog.products("HWRF", "summary", start, end)
+    for date, hour, hwrf_sum in summaries:
+        _add(state, date + hour, read_summary(hwrf_sum))
+    _save(state)
+    if summaries:
+        _write_product(state)
+    logging.info(f"storm totals replayed: {len(summaries)} cycles")
+
+
+def update(adate, summary):
+    """add the zonal stats of a cycle to the totals, write the storm-total
+    product of the cycle
+    -- summary: indexed by pfaf_id, MeanRain and MaxRain
+    -- a cycle not after the latest cycle added is skipped, replay() adds the
+       cycles in order
+    """
+
+    state = load()
+    if state is None:
+        # the summary of the cycle is in the catalog already
+        replay(end=adate[:8])
+        return
+    if _hours(adate) <= int(state["latest"]):
+        logging.info(f"storm totals: {adate} is not after the latest cycle")
+        return
+
+    _add(state, adate, summary)
+    _save(state)
+    _write_product(state)
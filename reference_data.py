@@ -0,0 +1,126 @@
+"""
+reference_data.py
+    -- static tables shared by the MoM modules, read once per process
+    -- attributes: data/Attributes.csv
+    -- resilience: data/Resilience_Index.csv
+    -- watershed_attributes: attributes joined with the resilience index (join1)
+    -- admin_centroids: data/Admin0_1_union_centroid.csv
+    -- the tables are cached as parquet in REFERENCE_DIR with categorical text
+       columns, the cache is rebuilt when a source csv changes
+"""
+
+import functools
+import logging
+import os
+
+import pandas as pd
+
+import settings
+
+ATTRIBUTES_CSV = os.path.join(settings.BASE_DATA_DIR, "Attributes.csv")
+RESILIENCE_CSV = os.path.join(settings.BASE_DATA_DIR, "Resilience_Index.csv")
+ADMIN_CENTROIDS_CSV = os.path.join(
+    settings.BASE_DATA_DIR, "Admin0_1_union_centroid.csv"
+)
+
+# text columns with few distinct values
+CATEGORIES = {
+    "attributes": ["ISO", "Admin0", "Admin1"],
+    "resilience": ["Country_Name", "ISO"],
+    "watershed_attributes": ["ISO", "Admin0", "Admin1"],
+    "admin_centroids": ["name", "name_1", "Admin1_names"],
+}
+
+
+def _read_attributes():
+    return pd.read_csv(ATTRIBUTES_CSV)
+
+
+def _read_resilience():
+    return pd.read_csv(RESILIENCE_CSV)
+
+
+def _read_watershed_attributes():
+    return pd.merge(
+        _read_attributes(),
+        _read_resilience()[["ISO", "Resilience_Index", " NormalizedLackofResilience "]],
+        on="ISO",
+        how="inner",
+    )
+
+
+def _read_admin_centroids():
+    return pd.read_csv(ADMIN_CENTROIDS_CSV, encoding="Windows-1252")
+
+
+# table name: reader, source files
+TABLES = {
+    "attributes": (_read_attributes, [ATTRIBUTES_CSV]),
+    "resilience": (_read_resilience, [RESILIENCE_CSV]),
+    "watershed_attributes": (
+        _read_watershed_attributes,
+        [ATTRIBUTES_CSV, RESILIENCE_CSV],
+    ),
+    "admin_centroids": (_read_admin_centroids, [ADMIN_CENTROIDS_CSV]),
+}
+
+
+def _build(name, cache_file):
+    """read a table from its sources and write the parquet cache"""
+
+    reader, _ = TABLES[name]
+    df = reader()
+    for column in CATEGORIES[name]:
+        df[column] = df[column].astype("category")
+
+    try:
+        os.makedirs(settings.REFERENCE_DIR, exist_ok=True)
+        # several jobs may build the cache at the same time
+        tmp_file = f"{cache_file}.{os.getpid()}.part"
+        df.to_parquet(tmp_file, index=False)
+        os.replace(tmp_file, cache_file)
+        logging.info("reference data cached: " + cache_file)
+    except OSError as e:
+        logging.warning(f"reference data not cached {name}: {e}")
+
+    return df
+
+
+@functools.lru_cache(maxsize=len(TABLES))
+def _load(name, version):
+    """table from the parquet cache, version: mtimes of the source files"""
+
+    cache_file = os.path.join(settings.REFERENCE_DIR, name + ".parquet")
+    if os.path.exists(cache_file) and os.path.getmtime(cache_file) >= max(version):
+        return pd.read_parquet(cache_file)
+
+    return _build(name, cache_file)
+
+
+def load(name):
+    """a reference table by name, a copy that the caller can modify"""
+
+    _, sources = TABLES[name]
+    version = tuple(os.path.getmtime(x) for x in sources)
+
+    return _load(name, version).copy()
+
+
+def attributes():
+    """watershed attributes: pfaf_id, area_km2, ISO, Admin0, Admin1, rfr/cfr scores"""
+    return load("attributes")
+
+
+def resilience():
+    """resilience index by country"""
+    return load("resilience")
+
+
+def watershed_attributes():
+    """watershed attributes with the resilience index of the country"""
+    return load("watershed_attributes")
+
+
+def admin_centroids():
+    """admin0/admin1 names and centroid of the watersheds"""
+    return load("admin_centroids")
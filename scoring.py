@@ -0,0 +1,651 @@
+"""
+scoring.py
+    -- hazard scores of the MoM inputs: GFMS, HWRF, DFO and VIIRS summaries
+    -- the rules are read from data/*_Weightage.csv and applied to whole columns
+    -- capped: x / wt > max_pt ? max_pt * multiplier : min_pt * multiplier * x / wt
+    -- stepped: x >= min_wt ? min((x - min_wt) / increment + min_pt, max_pt) : 0
+    -- bit for bit with the former per-row code: the scores are computed with
+       the same float operations, then read back as the former code read its
+       temp csv files with read_data; the GloFAS scores are summed station by
+       station as in the former loop
+    -- GloFAS stations: validation, scores and average by watershed
+    -- hazard fusion of the joined sources: Hazard_Score, Flag, Severity, Alert
+    -- alert level of the watersheds from Severity and Hazard_Score
+    -- scored tables are cached by source file and weightage version, e.g. the
+       GFMS summary and GloFAS file of a date are scored once for
+       flood_severity and the four HWRF cycles
+"""
+
+import functools
+import hashlib
+import io
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+import settings
+import watershed_store
+from utilities import glofas_file, read_data, read_glofas
+
+# score column, summary column, rule, weightage columns of the rule
+# capped: wt, min_pt, max_pt[, multiplier]
+# stepped: min_wt, increment, min_pt, max_pt
+RULES = {
+    "GFMS": {
+        "scores": [
+            (
+                "GFMS_area_score",
+                "GFMS_TotalArea_km",
+                "capped",
+                ["GFMS_Area_wt", "GFMS_Area_Min_pt", "GFMS_Area_max_pt"],
+            ),
+            (
+                "GFMS_perc_area_score",
+                "GFMS_perc_Area",
+                "capped",
+                ["GFMS_percArea_wt", "GFMS_percArea_Minpt", "GFMS_percArea_Maxpt"],
+            ),
+            (
+                "MeanD_Score",
+                "GFMS_MeanDepth",
+                "capped",
+                ["GFMS_Meandepth_wt", "GFMS_Meandepth_Minpt", "GFMS_Meandepth_Maxpt"],
+            ),
+            (
+                "MaxD_Score",
+                "GFMS_MaxDepth",
+                "capped",
+                ["GFMS_Maxdepth_wt", "GFMS_Maxdepth_Minpt", "GFMS_Maxdepth_Maxpt"],
+            ),
+            (
+                "Duration_Score",
+                "GFMS_Duration",
+                "capped",
+                ["GFMS_Duration_wt", "GFMS_Duration_Minpt", "GFMS_Duration_Maxpt"],
+            ),
+        ],
+        "total": "Sum_Score",
+        "scale": None,
+    },
+    "HWRF": {
+        "scores": [
+            (
+                "HWRF_area_score",
+                "Rain_TotalArea_km",
+                "capped",
+                ["HWRF_Area_wt", "HWRF_Area_Min_pt", "HWRF_Area_max_pt"],
+            ),
+            (
+                "HWRF_percarea_score",
+                "perc_Area",
+                "capped",
+                ["HWRF_percArea_wt", "HWRF_percArea_Minpt", "HWRF_percArea_Maxpt"],
+            ),
+            (
+                "MeanRain_Score",
+                "MeanRain",
+                "stepped",
+                [
+                    "HWRF_MeanRain_minwt",
+                    "HWRF_MeanRain_increment",
+                    "HWRF_MeanRain_Minpt",
+                    "HWRF_MeanRain_Maxpt",
+                ],
+            ),
+            (
+                "MaxRain_Score",
+                "MaxRain",
+                "stepped",
+                [
+                    "HWRF_MaxRain_minwt",
+                    "HWRF_MaxRain_increment",
+                    "HWRF_MaxRain_Minpt",
+                    "HWRF_MaxRain_Maxpt",
+                ],
+            ),
+        ],
+        "total": "HWRFTot_Score",
+        "scale": 2.5,
+    },
+    "DFO": {
+        "scores": [
+            (
+                "DFO_area_1day_score",
+                "1-Day_CS_TotalArea_km2",
+                "capped",
+                [
+                    "DFO_Area_wt",
+                    "DFO_Area_Min_pt",
+                    "DFO_Area_max_pt",
+                    "one_Day_Multiplier",
+                ],
+            ),
+            (
+                "DFO_percarea_1day_score",
+                "1-Day_CS_perc_Area",
+                "capped",
+                [
+                    "DFO_percArea_wt",
+                    "DFO_percArea_Minpt",
+                    "DFO_percArea_Maxpt",
+                    "one_Day_Multiplier",
+                ],
+            ),
+            (
+                "DFO_area_2day_score",
+                "2-Day_TotalArea_km2",
+                "capped",
+                [
+                    "DFO_Area_wt",
+                    "DFO_Area_Min_pt",
+                    "DFO_Area_max_pt",
+                    "two_Day_Multiplier",
+                ],
+            ),
+            (
+                "DFO_percarea_2day_score",
+                "2-Day_perc_Area",
+                "capped",
+                [
+                    "DFO_percArea_wt",
+                    "DFO_percArea_Minpt",
+                    "DFO_percArea_Maxpt",
+                    "two_Day_Multiplier",
+                ],
+            ),
+            (
+                "DFO_area_3day_score",
+                "3-Day_TotalArea_km2",
+                "capped",
+                [
+                    "DFO_Area_wt",
+                    "DFO_Area_Min_pt",
+                    "DFO_Area_max_pt",
+                    "three_Day_Multiplier",
+                ],
+            ),
+            (
+                "DFO_percarea_3day_score",
+                "3-Day_perc_Area",
+                "capped",
+                [
+                    "DFO_percArea_wt",
+                    "DFO_percArea_Minpt",
+                    "DFO_percArea_Maxpt",
+                    "three_Day_Multiplier",
+                ],
+            ),
+        ],
+        "total": "DFOTotal_Score",
+        "scale": None,
+    },
+    "VIIRS": {
+        "scores": [
+            (
+                "VIIRS_area_1day_score",
+                "onedayFlood_Area_km",
+                "capped",
+                [
+                    "VIIRS_Area_wt",
+                    "VIIRS_Area_Min_pt",
+                    "VIIRS_Area_max_pt",
+                    "one_Day_Multiplier",
+                ],
+            ),
+            (
+                "VIIRS_percarea_1day_score",
+                "onedayperc_Area",
+                "capped",
+                [
+                    "VIIRS_percArea_wt",
+                    "VIIRS_percArea_Minpt",
+                    "VIIRS_percArea_Maxpt",
+                    "one_Day_Multiplier",
+                ],
+            ),
+            (
+                "VIIRS_area_5day_score",
+                "fivedayFlood_Area_km",
+                "capped",
+                [
+                    "VIIRS_Area_wt",
+                    "VIIRS_Area_Min_pt",
+                    "VIIRS_Area_max_pt",
+                    "five_Day_Multiplier",
+                ],
+            ),
+            (
+                "VIIRS_percarea_5day_score",
+                "fivedayperc_Area",
+                "capped",
+                [
+                    "VIIRS_percArea_wt",
+                    "VIIRS_percArea_Minpt",
+                    "VIIRS_percArea_Maxpt",
+                    "five_Day_Multiplier",
+                ],
+            ),
+        ],
+        "total": "VIIRSTotal_Score",
+        "scale": None,
+    },
+}
+
+# points by days until peak, 10 days and more: 1 point
+# 0 days has no points, the station keeps the points of the previous station
+PEAK_ARRIVAL_POINTS = np.array([np.nan, 10, 9, 8, 7, 6, 5, 4, 3, 2, 1])
+
+# GloFAS validation, the first failed check is reported
+GLOFAS_CHECKS = [
+    (
+        lambda x: (x["Alert_level"] > 3) | (x["Alert_level"] < 0),
+        "Alert less than 0 or greater than 3 is encountered",
+    ),
+    (lambda x: x["GloFAS_2yr"] > 100, "2 yr EPS greater than 100 is encountered"),
+    (lambda x: x["GloFAS_5yr"] > 100, "5 yr EPS greater than 100 is encountered"),
+    (lambda x: x["GloFAS_20yr"] > 100, "20 yr EPS greater than 100 is encountered"),
+    (
+        lambda x: x["Days_until_peak"] > 30,
+        "Peak arrival days greater than 30 is encountered",
+    ),
+]
+
+# alert levels from low to high, the integer code of a level is its index + 1
+ALERT_LEVELS = ["Information", "Advisory", "Watch", "Warning"]
+ALERT_DTYPE = pd.CategoricalDtype(ALERT_LEVELS, ordered=True)
+
+# days a scored table is kept in SCORE_CACHE_DIR
+SCORE_CACHE_DAYS = 7
+# version of the scored tables, a new version does not use the cached tables
+SCORE_CACHE_VERSION = 2
+
+_weightage_cache = {}
+
+
+def capped(x, wt, min_pt, max_pt, multiplier=1.0):
+    """capped linear score"""
+    x = np.asarray(x, dtype=float)
+    return np.where(x / wt > max_pt, max_pt * multiplier, min_pt * multiplier * x / wt)
+
+
+def stepped(x, min_wt, increment, min_pt, max_pt):
+    """score by increments above a threshold, 0 below the threshold"""
+    x = np.asarray(x, dtype=float)
+    steps = ((x - min_wt) / increment) + min_pt
+    return np.where(x >= min_wt, np.where(steps > max_pt, max_pt, steps), 0.0)
+
+
+RULE_FUNCTIONS = {"capped": capped, "stepped": stepped}
+
+
+def _load_weightage(source):
+    """weightage values and hash of a source, reloaded when the csv changes"""
+
+    weightage_csv = os.path.join(settings.BASE_DATA_DIR, f"{source}_Weightage.csv")
+    mtime = os.path.getmtime(weightage_csv)
+    cached = _weightage_cache.get(source)
+    if cached is None or cached[0] != mtime:
+        weightage = read_data(weightage_csv)
+        values = {x: float(weightage[x][0]) for x in weightage.columns}
+        with open(weightage_csv, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        _weightage_cache[source] = (mtime, values, digest)
+
+    return _weightage_cache[source][1:]
+
+
+def load_weightage(source):
+    """weightage of a source (GFMS, HWRF, DFO, VIIRS) as a dict of floats"""
+    return _load_weightage(source)[0]
+
+
+def weightage_hash(source):
+    """hash of the weightage csv of a source"""
+    return _load_weightage(source)[1]
+
+
+def read_summary(summary_csv):
+    """read a summary csv, floats are parsed as float() does"""
+    return pd.read_csv(summary_csv, float_precision="round_trip")
+
+
+def read_back(frame, columns=None):
+    """float columns of a frame as read_data reads them back from a csv file
+    of the frame
+    -- the default parser of read_csv is not correctly rounded, a value can be
+       read back 1 ulp off the written value
+    -- columns: default all float columns
+    """
+
+    if columns is None:
+        columns = frame.select_dtypes("float").columns
+    columns = list(columns)
+    if len(columns) == 0:
+        return frame
+    back = pd.read_csv(io.StringIO(frame[columns].to_csv(index=False)))
+
+    return frame.assign(**{x: back[x].to_numpy() for x in columns})
+
+
+def score_columns(source):
+    """score columns and total score column of a source"""
+    rules = RULES[source]
+    return [x[0] for x in rules["scores"]] + [rules["total"]]
+
+
+def score(summary, source):
+    """append the score columns and the total score of a source to a summary
+    -- the summary as parsed by float(), the scores as computed
+    """
+
+    weightage = load_weightage(source)
+    rules = RULES[source]
+
+    scores = {}
+    for score_column, column, rule, params in rules["scores"]:
+        scores[score_column] = RULE_FUNCTIONS[rule](
+            summary[column], *[weightage[x] for x in params]
+        )
+
+    # left to right as in the former per-row sum
+    values = list(scores.values())
+    total = values[0]
+    for x in values[1:]:
+        total = total + x
+    if rules["scale"] is not None:
+        total = total * rules["scale"]
+    scores[rules["total"]] = total
+
+    return summary.assign(**scores)
+
+
+def score_table(summary, source):
+    """scored summary as the former code read it from its temp csv file"""
+    return read_back(score(summary, source))
+
+
+def score_csv(summary_csv, source):
+    """scored summary csv as the former code read it from its temp csv file
+    -- the scores are computed from the summary parsed by float(), the summary
+       columns are read with read_data
+    """
+
+    scores = score(read_summary(summary_csv), source)[score_columns(source)]
+
+    return read_data(summary_csv).assign(**read_back(scores))
+
+
+def glofas_errors(glofas):
+    """error message of each GloFAS station, empty if the station is valid"""
+    errors = np.select(
+        [check(glofas).to_numpy() for check, _ in GLOFAS_CHECKS],
+        [message for _, message in GLOFAS_CHECKS],
+        default="",
+    )
+
+    return pd.Series(errors, index=glofas.index)
+
+
+def write_glofas_report(report, error_csv):
+    """write the invalid GloFAS stations, a previous report is removed if
+    all stations are valid
+    """
+
+    if len(report):
+        report.to_csv(error_csv, index=False, lineterminator="\r\n")
+    elif os.path.exists(error_csv):
+        os.remove(error_csv)
+
+
+def score_glofas(glofas, error_csv=None):
+    """score the GloFAS stations and average Sum_Score by watershed
+    -- the invalid stations are reported in error_csv, if given
+    -- the other columns are taken from the last station of each watershed
+    """
+
+    scores, report = _score_glofas(glofas)
+    if error_csv is not None:
+        write_glofas_report(report, error_csv)
+
+    return scores
+
+
+def _score_glofas(glofas):
+    """GloFAS scores by watershed and report of the invalid stations"""
+
+    errors = glofas_errors(glofas)
+    invalid = errors != ""
+    report = glofas.loc[invalid, ["Point No", "Station", "pfaf_id"]]
+    report = report.assign(Error=errors[invalid])
+
+    weightage = load_weightage("GFMS")
+    stations = glofas.loc[
+        ~invalid,
+        [
+            "pfaf_id",
+            "Alert_level",
+            "Days_until_peak",
+            "GloFAS_2yr",
+            "GloFAS_5yr",
+            "GloFAS_20yr",
+        ],
+    ]
+    alert = stations["Alert_level"].to_numpy(dtype=float)
+    two = stations["GloFAS_2yr"].to_numpy(dtype=float)
+    five = stations["GloFAS_5yr"].to_numpy(dtype=float)
+    twenty = stations["GloFAS_20yr"].to_numpy(dtype=float)
+
+    alert_score = np.rint(alert * weightage["Alert_score"]).astype(np.int64)
+    days = np.clip(stations["Days_until_peak"].to_numpy(), 0, 10)
+    no_flood = (two == 0) & (five == 0) & (twenty == 0) & (alert == 0)
+    peak = np.where(no_flood, 0, PEAK_ARRIVAL_POINTS[days])
+    peak = pd.Series(peak).ffill().fillna(0).to_numpy().astype(np.int64)
+
+    scores = stations.assign(
+        Alert_Score=alert_score,
+        PeakArrivalScore=peak,
+        TwoYScore=two / weightage["EPS_Twoyear_wt"],
+        FiveYScore=five / weightage["EPS_Fiveyear_wt"],
+        TwtyYScore=twenty / weightage["EPS_Twtyyear_wt"],
+    )
+    scores["Sum_Score"] = (
+        alert_score.astype(float)
+        + peak.astype(float)
+        + scores["TwoYScore"]
+        + scores["FiveYScore"]
+        + scores["TwtyYScore"]
+    )
+    # the station scores as read back from the temp csv of the former code
+    scores = read_back(scores, ["TwoYScore", "FiveYScore", "TwtyYScore", "Sum_Score"])
+
+    # average by watershed, summed station by station in pfaf_id order
+    scores = scores.sort_values(by="pfaf_id")
+    pfaf_id = scores["pfaf_id"].to_numpy()
+    new = np.ones(len(pfaf_id), dtype=bool)
+    new[1:] = pfaf_id[1:] != pfaf_id[:-1]
+    first = np.flatnonzero(new)
+    count = np.diff(np.r_[first, len(pfaf_id)])
+    station_score = scores["Sum_Score"].to_numpy()
+    total = station_score[first]
+    for i in range(1, count.max(initial=1)):
+        more = count > i
+        total[more] = total[more] + station_score[first[more] + i]
+    # the last station of each watershed, read back once more with the average
+    scores = scores.iloc[first + count - 1].assign(Sum_Score=total / count)
+    scores = read_back(scores, ["TwoYScore", "FiveYScore", "TwtyYScore", "Sum_Score"])
+
+    return scores.reset_index(drop=True), report
+
+
+def classify_alert(df):
+    """alert level of each watershed as an ordered categorical
+    -- the first matching level from Warning down to Information
+    -- the bounds are exclusive, a watershed matching no level has no alert
+    """
+
+    severity = df["Severity"].to_numpy(dtype=float)
+    hazard = df["Hazard_Score"].to_numpy(dtype=float)
+    conditions = [
+        (severity > 0.8) | (hazard > 80),
+        ((severity > 0.6) & (severity < 0.8)) | ((hazard > 60) & (hazard < 80)),
+        ((severity > 0.35) & (severity < 0.6)) | ((hazard > 35) & (hazard < 60)),
+        ((severity > 0) & (severity < 0.35)) | ((hazard > 0) & (hazard < 35)),
+    ]
+    codes = np.select(conditions, [3, 2, 1, 0], default=-1)
+
+    return pd.Series(
+        pd.Categorical.from_codes(codes, dtype=ALERT_DTYPE), index=df.index
+    )
+
+
+def _write_cache(cache_file, table):
+    """write a scored table, several jobs may write the same file"""
+
+    tmp_file = f"{cache_file}.{os.getpid()}.part"
+    table.to_parquet(tmp_file, index=False)
+    os.replace(tmp_file, cache_file)
+
+
+def _prune_cache():
+    """remove the scored tables older than SCORE_CACHE_DAYS"""
+
+    expired = time.time() - SCORE_CACHE_DAYS * 86400
+    for name in os.listdir(settings.SCORE_CACHE_DIR):
+        cache_file = os.path.join(settings.SCORE_CACHE_DIR, name)
+        if os.path.getmtime(cache_file) < expired:
+            os.remove(cache_file)
+
+
+@functools.lru_cache(maxsize=16)
+def _score_file(data_file, source, version):
+    """scored table of a file and, for GloFAS, the report of the invalid stations
+    -- version: mtime and size of the file, hash of the weightage
+    """
+
+    name = os.path.splitext(os.path.basename(data_file))[0]
+    key = (data_file, version, SCORE_CACHE_VERSION)
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+    cache_file = os.path.join(settings.SCORE_CACHE_DIR, f"{name}_{digest}.parquet")
+    report_file = cache_file.replace(".parquet", "_errors.parquet")
+
+    if os.path.exists(cache_file):
+        table = pd.read_parquet(cache_file)
+        report = pd.read_parquet(report_file) if source == "GloFAS" else None
+        return table, report
+
+    if source == "GloFAS":
+        table, report = _score_glofas(read_glofas(data_file))
+    else:
+        table, report = score_csv(data_file, source), None
+
+    try:
+        os.makedirs(settings.SCORE_CACHE_DIR, exist_ok=True)
+        _prune_cache()
+        # the report first, the table marks a complete entry
+        if report is not None:
+            _write_cache(report_file, report)
+        _write_cache(cache_file, table)
+    except OSError as e:
+        logging.warning(f"scores not cached {data_file}: {e}")
+
+    return table, report
+
+
+def _file_version(data_file, source):
+    stat = os.stat(data_file)
+    return (stat.st_mtime_ns, stat.st_size, weightage_hash(source))
+
+
+def score_file(summary_csv, source):
+    """scored summary of a source (GFMS, HWRF, DFO, VIIRS), cached"""
+
+    table, _ = _score_file(summary_csv, source, _file_version(summary_csv, source))
+
+    return table.copy()
+
+
+def score_glofas_file(glofas_csv, error_csv=None):
+    """GloFAS scores by watershed of a GloFAS file, cached
+    -- the invalid stations are reported in error_csv, if given
+    """
+
+    # the GloFAS scores use the GFMS weightage
+    version = _file_version(glofas_file(glofas_csv), "GFMS")
+    table, report = _score_file(glofas_csv, "GloFAS", version)
+    if error_csv is not None:
+        write_glofas_report(report, error_csv)
+
+    return table.copy()
+
+
+def mom_score(frame):
+    """MoM score of the joined watersheds: GloFAS (Sum_Score_x) + GFMS (Sum_Score_y)
+    -- a missing score is 0, a score is doubled when the other source is 0
+    -- the doubled scores are written back to the frame
+    """
+
+    glofas = frame["Sum_Score_x"].fillna(0).to_numpy(dtype=float)
+    gfms = frame["Sum_Score_y"].fillna(0).to_numpy(dtype=float)
+    glofas = np.where(gfms == 0, glofas * 2, glofas)
+    gfms = np.where(glofas == 0, gfms * 2, gfms)
+    frame["Sum_Score_x"] = glofas
+    frame["Sum_Score_y"] = gfms
+
+    return glofas + gfms
+
+
+def fuse_hazard(frame, total=None, flag=None):
+    """Hazard_Score, Flag, Severity and Alert of the joined watersheds
+    -- total: total score column of a source, Hazard_Score is the max of both
+    -- flag: Flag where the source raises Hazard_Score, None: no Flag column
+    -- the watersheds without hazard or without riverine and coastal risk
+       are dropped
+    -- Severity: normal cdf of log(Hazard_Score) around the risk baseline
+    -- Flag is cleared for Information and Advisory
+    """
+
+    hazard = frame["Hazard_Score"].to_numpy(dtype=float)
+    if flag is not None and "Flag" in frame.columns:
+        flags = frame["Flag"].copy()
+    else:
+        flags = pd.Series(np.nan, index=frame.index)
+    if total is not None:
+        source = frame[total].to_numpy(dtype=float)
+        if flag is not None:
+            flags[hazard < source] = flag
+            frame["Flag"] = flags
+        hazard = np.fmax(hazard, source)
+        frame["Hazard_Score"] = hazard
+
+    rfr = frame["rfr_score"].to_numpy(dtype=float)
+    cfr = frame["cfr_score"].to_numpy(dtype=float)
+    keep = (hazard != 0) & ~((rfr == 0) & (cfr == 0))
+    frame = frame[keep].assign(
+        Scaled_Riverine_Risk=rfr[keep] * 20, Scaled_Coastal_Risk=cfr[keep] * 20
+    )
+
+    baseline = watershed_store.risk_baseline(frame.index)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # watersheds missing in the reference tables
+        missing = np.isnan(baseline)
+        if missing.any():
+            risk = np.fmax(rfr[keep] * 20, cfr[keep] * 20)
+            baseline = np.where(missing, np.log(100 - risk), baseline)
+        frame["Severity"] = ndtr(np.log(hazard[keep]) - baseline)
+    frame["Alert"] = classify_alert(frame)
+
+    if flag is not None:
+        flags = flags[keep].astype(object)
+        flags[frame["Alert"].isin(ALERT_LEVELS[:2]).to_numpy()] = ""
+        frame["Flag"] = flags
+
+    return frame
+
+
+def alert_codes(alerts):
+    """integer code of the alert levels: 1 to 4, 0 for no alert"""
+    return pd.Categorical(alerts, dtype=ALERT_DTYPE).codes.astype(np.int64) + 1
@@ -32,6 +32,8 @@ PRODUCT_DIR = os.path.expanduser(
 GLOFAS_PROC_DIR = os.path.join(WORKING_DIR, config.get("processing_dir", "glofas"))
 GLOFAS_DIR = os.path.join(PRODUCT_DIR, config.get("products_dir", "GLOFAS"))
 GLOFAS_SUM_DIR = os.path.join(PRODUCT_DIR, config.get("products_dir", "GLOFAS"))
+GLOFAS_MANIFEST = os.path.join(GLOFAS_PROC_DIR, "glofas_manifest.json")
+GLOFAS_PFAF_CACHE = os.path.join(GLOFAS_PROC_DIR, "glofas_station_pfaf.csv")
 
 # config GFMS directory
 GFMS_PROC_DIR = os.path.join(WORKING_DIR, config.get("processing_dir", "gfms"))
@@ -39,6 +41,11 @@ GFMS_DIR = os.path.join(PRODUCT_DIR, config.get("products_dir", "GFMS"))
 GFMS_SUM_DIR = os.path.join(GFMS_DIR, "GFMS_summary")
 GFMS_IMG_DIR = os.path.join(GFMS_DIR, "GFMS_image")
 GFMS_MOM_DIR = os.path.join(GFMS_DIR, "GFMS_MoM")
+# GFMS datacube: depth grid and watershed summary
+GFMS_CUBE = os.path.join(GFMS_DIR, "gfms_cube.h5")
+GFMS_WATERSHED_CUBE = os.path.join(GFMS_DIR, "gfms_watershed_cube.h5")
+# bins not appended to the datacube yet
+GFMS_CUBE_BACKFILL = os.path.join(GFMS_DIR, "gfms_cube_backfill.json")
 
 # config DFO directory
 DFO_PROC_DIR = os.path.join(WORKING_DIR, config.get("processing_dir", "dfo"))
@@ -60,6 +67,7 @@ HWRF_DIR = os.path.join(PRODUCT_DIR, config.get("products_dir", "HWRF"))
 HWRF_SUM_DIR = os.path.join(HWRF_DIR, "HWRF_summary")
 HWRF_IMG_DIR = os.path.join(HWRF_DIR, "HWRF_image")
 HWRF_MOM_DIR = os.path.join(HWRF_DIR, "HWRF_MoM")
+HWRF_TOTAL_DIR = os.path.join(HWRF_DIR, "HWRF_total")
 # HWRF time_delay: 6 hours
 HWRF_TIME_DELAY = 6
 
@@ -70,6 +78,18 @@ FINAL_MOM_DIR = os.path.join(PRODUCT_DIR, config.get("products_dir", "FINAL"))
 # config watershed shp file
 WATERSHED_DIR = os.path.join(BASE_DIR, "data", "watershed_shp")
 WATERSHED_SHP = os.path.join(WATERSHED_DIR, "Watershed_pfaf_id.shp")
+# parquet cache of the reference tables in data/
+REFERENCE_DIR = os.path.join(WORKING_DIR, "reference")
+# scored GFMS/GloFAS/DFO/VIIRS tables, shared by the MoM stages
+SCORE_CACHE_DIR = os.path.join(WORKING_DIR, "scores")
+# catalog of the products
+CATALOG_DB = os.path.join(WORKING_DIR, "catalog.sqlite")
+# alert levels of the watersheds by HWRF cycle
+ALERT_STATE_DIR = os.path.join(WORKING_DIR, "alert_state")
+# ETag/Last-Modified and links of the upstream directory listings
+LISTING_CACHE = os.path.join(WORKING_DIR, "listing_cache.json")
+# running storm-total HWRF rainfall by watershed
+RAIN_TOTAL_STATE = os.path.join(WORKING_DIR, "rain_total.npz")
 
 # setup logging
 # generate a new log for each month
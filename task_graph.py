@@ -0,0 +1,109 @@
+"""
+task_graph.py
+    -- run a graph of tasks in a process pool
+    -- a task: name -> (function, args, names of the tasks it depends on)
+    -- a task starts as soon as the tasks it depends on are finished, the
+       independent tasks run at the same time
+    -- the tasks depending on a failed task are skipped
+    -- critical path: the chain of dependent tasks with the longest run time
+"""
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+
+def topological_order(tasks):
+    """task names, each after the tasks it depends on"""
+
+    order = []
+    state = {}
+
+    def visit(name, chain):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError("dependency cycle: " + " -> ".join(chain + [name]))
+        state[name] = "visiting"
+        for dependency in tasks[name][2]:
+            if dependency not in tasks:
+                raise ValueError(f"unknown dependency of {name}: {dependency}")
+            visit(dependency, chain + [name])
+        state[name] = "done"
+        order.append(name)
+
+    for name in tasks:
+        visit(name, [])
+
+    return order
+
+
+def _timed(function, args):
+    """run a task in a worker, return its start and end time"""
+
+    start = time.time()
+    function(*args)
+
+    return start, time.time()
+
+
+def run(tasks, workers=None):
+    """run the tasks, return {name: (start, end)} of the finished tasks"""
+
+    waiting = {name: tasks[name] for name in topological_order(tasks)}
+    running = {}
+    timings = {}
+    failed = set()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while waiting or running:
+            # in topological order, a skipped task is seen before its dependents
+            for name, (function, args, dependencies) in list(waiting.items()):
+                if any(x in failed for x in dependencies):
+                    logging.warning(f"skipped {name}: a dependency failed")
+                    failed.add(name)
+                    del waiting[name]
+                elif all(x in timings for x in dependencies):
+                    running[pool.submit(_timed, function, args)] = name
+                    del waiting[name]
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    timings[name] = future.result()
+                except Exception:
+                    logging.exception(f"failed {name}")
+                    failed.add(name)
+
+    return timings
+
+
+def critical_path(tasks, timings):
+    """[names], run time of the chain of dependent finished tasks with the
+    longest run time
+    """
+
+    length = {}
+    previous = {}
+    for name in topological_order(tasks):
+        if name not in timings:
+            continue
+        start, end = timings[name]
+        before = [x for x in tasks[name][2] if x in length]
+        last = max(before, key=length.get, default=None)
+        length[name] = end - start + (length[last] if last is not None else 0)
+        previous[name] = last
+
+    if not length:
+        return [], 0.0
+
+    last = max(length, key=length.get)
+    path = []
+    name = last
+    while name is not None:
+        path.append(name)
+        name = previous[name]
+
+    return path[::-1], length[last]
@@ -0,0 +1,19 @@
+"""
+conftest.py
+    -- the modules are imported from the repo folder
+    -- production.cfg is created from sample_production.cfg if missing, as
+       initialize.py does
+"""
+
+import os
+import shutil
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+if not os.path.exists(os.path.join(BASE_DIR, "production.cfg")):
+    shutil.copyfile(
+        os.path.join(BASE_DIR, "sample_production.cfg"),
+        os.path.join(BASE_DIR, "production.cfg"),
+    )
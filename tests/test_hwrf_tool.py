@@ -0,0 +1,151 @@
+"""
+test_hwrf_tool.py
+    -- the HWRF cron job offline: the listings, the downloads and the cycle
+       processing are replaced by fakes
+    -- generate_procesing_list returns the url of the cycles to process
+    -- _hwrf_fetch writes a .part file, keeps a complete file and rejects a
+       truncated download
+    -- HWRF_cron goes on with the other cycles when a cycle fails
+"""
+
+import os
+
+import pytest
+import requests
+
+import HWRF_tool
+import settings
+
+
+class FakeResponse:
+    def __init__(self, content, size=None, status=200):
+        self.content = content
+        self.status_code = status
+        self.ok = status < 400
+        self.headers = {}
+        if size is not None:
+            self.headers["Content-Length"] = str(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError(f"{self.status_code}")
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+
+class FakeSession:
+    """serves a file, Content-Length is the size announced by the server"""
+
+    def __init__(self, content, size):
+        self.content = content
+        self.size = size
+        self.requests = []
+
+    def head(self, url, **kwargs):
+        self.requests.append("HEAD")
+        return FakeResponse(b"", self.size)
+
+    def get(self, url, **kwargs):
+        self.requests.append("GET")
+        return FakeResponse(self.content, self.size)
+
+
+def test_generate_procesing_list(monkeypatch):
+    hosturl = "https://host/hwrf/prod/"
+    listings = {
+        hosturl: ["hwrf.20250914/", "hwrf.20250915/", "index.html"],
+        hosturl + "hwrf.20250914/": ["00/", "06/", "12/", "18/"],
+        hosturl + "hwrf.20250915/": ["00/", "06/", "readme.txt"],
+    }
+    monkeypatch.setitem(settings.config["hwrf"], "HOST", hosturl)
+    monkeypatch.setattr(
+        HWRF_tool.listing_cache,
+        "listing",
+        lambda url, refresh=False: [listings[url], False],
+    )
+    # 2025091412 is processed, 2025091506 is too recent
+    monkeypatch.setattr(HWRF_tool, "check_status", lambda x: x == "2025091412")
+    monkeypatch.setattr(HWRF_tool, "check_hours", lambda x: x == "2025091506")
+
+    assert HWRF_tool.generate_procesing_list() == {
+        "2025091400": hosturl + "hwrf.20250914/00/",
+        "2025091406": hosturl + "hwrf.20250914/06/",
+        "2025091418": hosturl + "hwrf.20250914/18/",
+        "2025091500": hosturl + "hwrf.20250915/00/",
+    }
+
+
+def test_hwrf_fetch(tmp_path):
+    save_file = tmp_path / "storm.2025091500.rainfall.ascii"
+    session = FakeSession(b"rainfall" * 1000, 8000)
+    HWRF_tool._hwrf_fetch(session, "url", str(save_file))
+    assert save_file.read_bytes() == b"rainfall" * 1000
+    assert os.listdir(tmp_path) == [save_file.name]
+
+    # complete, not downloaded again
+    session.requests.clear()
+    HWRF_tool._hwrf_fetch(session, "url", str(save_file))
+    assert session.requests == ["HEAD"]
+
+
+def test_hwrf_fetch_changed(tmp_path):
+    save_file = tmp_path / "storm.2025091500.rainfall.ascii"
+    save_file.write_bytes(b"partial")
+    session = FakeSession(b"rainfall", 8)
+    HWRF_tool._hwrf_fetch(session, "url", str(save_file))
+    assert session.requests == ["HEAD", "GET"]
+    assert save_file.read_bytes() == b"rainfall"
+
+
+def test_hwrf_fetch_truncated(tmp_path):
+    save_file = tmp_path / "storm.2025091500.rainfall.ascii"
+    # the connection is closed before the announced size
+    session = FakeSession(b"rain", 8)
+    with pytest.raises(IOError, match="incomplete download"):
+        HWRF_tool._hwrf_fetch(session, "url", str(save_file))
+    assert os.listdir(tmp_path) == []
+
+
+def test_hwrf_cron_failed_cycle(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "HWRF_PROC_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "BASE_DIR", str(tmp_path))
+    datelist = {
+        "2025091500": "url/00/",
+        "2025091506": "url/06/",
+        "2025091512": "url/12/",
+    }
+    monkeypatch.setattr(HWRF_tool, "generate_procesing_list", lambda: datelist)
+
+    def download(hwrfurl):
+        if hwrfurl == "url/00/":
+            raise requests.exceptions.ConnectionError("connection reset")
+        if hwrfurl == "url/06/":
+            raise IOError("incomplete download")
+        return ["storm.rainfall.ascii"]
+
+    processed = []
+    monkeypatch.setattr(HWRF_tool, "HWRF_download", download)
+    monkeypatch.setattr(
+        HWRF_tool, "process_rain", lambda key, a_list: [f"hwrf.{key}.tiff", []]
+    )
+    monkeypatch.setattr(
+        HWRF_tool,
+        "HWRF_extract_by_watershed",
+        lambda tiff, grids: [tiff.replace(".tiff", ".csv"), True, None],
+    )
+    monkeypatch.setattr(HWRF_tool.rain_total, "update", lambda key, summary: None)
+    monkeypatch.setattr(HWRF_tool, "hwrf_workflow", processed.append)
+
+    HWRF_tool.HWRF_cron()
+
+    # the failed cycles are left to the next run
+    assert processed == ["2025091512"]
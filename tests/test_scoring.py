@@ -0,0 +1,65 @@
+"""
+test_scoring.py
+    -- the scored tables of a sample day against the outputs of the former
+       per-row code: the temp csv files it wrote and read back with read_data
+    -- data/: the summaries of 2025-09-15, data/baseline/: the temp csv files
+       written by the former code for these summaries
+    -- the floats are compared bit for bit
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import scoring
+import settings
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+BASELINE_DIR = os.path.join(DATA_DIR, "baseline")
+
+SUMMARIES = [
+    ("GFMS", "Flood_byStor_2025091500.csv", "GFMS_w_score_2025091500.csv"),
+    ("HWRF", "hwrf.2025091512rainfall.csv", "HWRF_w_score_2025091512.csv"),
+    ("DFO", "DFO_20250915.csv", "DFO_w_score_20250915.csv"),
+    ("VIIRS", "VIIRS_Flood_20250915.csv", "VIIRS_w_score_20250915.csv"),
+]
+
+
+@pytest.fixture(autouse=True)
+def score_cache(tmp_path, monkeypatch):
+    """an empty score cache for each test"""
+    monkeypatch.setattr(settings, "SCORE_CACHE_DIR", str(tmp_path))
+    scoring._score_file.cache_clear()
+    yield
+    scoring._score_file.cache_clear()
+
+
+def assert_baseline(table, baseline_csv):
+    baseline = pd.read_csv(os.path.join(BASELINE_DIR, baseline_csv))
+    pd.testing.assert_frame_equal(
+        table[baseline.columns].reset_index(drop=True),
+        baseline,
+        check_dtype=False,
+        check_exact=True,
+    )
+
+
+@pytest.mark.parametrize("source, summary_csv, baseline_csv", SUMMARIES)
+def test_score_file(source, summary_csv, baseline_csv):
+    summary_csv = os.path.join(DATA_DIR, summary_csv)
+    assert_baseline(scoring.score_file(summary_csv, source), baseline_csv)
+    # from the score cache
+    scoring._score_file.cache_clear()
+    assert_baseline(scoring.score_file(summary_csv, source), baseline_csv)
+
+
+def test_score_table():
+    summary = scoring.read_summary(os.path.join(DATA_DIR, SUMMARIES[0][1]))
+    assert_baseline(scoring.score_table(summary, "GFMS"), SUMMARIES[0][2])
+
+
+def test_score_glofas_file():
+    glofas_csv = os.path.join(DATA_DIR, "threspoints_2025091500.csv")
+    table = scoring.score_glofas_file(glofas_csv)
+    assert_baseline(table, "GloFas_w_Avgscore_2025091500.csv")
@@ -30,6 +30,46 @@ def watersheds_gdb_reader():
     return watersheds
 
 
+# columns of the GloFAS summary: threspoints_YYYYMMDDHH.csv
+GLOFAS_COLUMNS = [
+    "Point No",
+    "Station",
+    "Basin",
+    "Country",
+    "Lat",
+    "Lon",
+    "Upstream area",
+    "Forecast Date",
+    "max_EPS",
+    "GloFAS_2yr",
+    "GloFAS_5yr",
+    "GloFAS_20yr",
+    "Alert_level",
+    "Days_until_peak",
+    "pfaf_id",
+]
+
+
+def glofas_file(glofas_csv):
+    """file read for a GloFAS summary: the GeoParquet next to the csv if there is one"""
+
+    glofas_parquet = glofas_csv.replace(".csv", ".parquet")
+    if os.path.exists(glofas_parquet):
+        return glofas_parquet
+
+    return glofas_csv
+
+
+def read_glofas(glofas_csv):
+    """read a GloFAS summary, from the GeoParquet next to the csv if there is one"""
+
+    glofas_data = glofas_file(glofas_csv)
+    if glofas_data.endswith(".parquet"):
+        return pd.read_parquet(glofas_data, columns=GLOFAS_COLUMNS)
+
+    return pd.read_csv(glofas_data)
+
+
 def read_data(datafile) -> pd.DataFrame:
     df = pd.read_csv(datafile)
     # df = pd.DataFrame(df)
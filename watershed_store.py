@@ -0,0 +1,99 @@
+"""
+watershed_store.py
+    -- per-watershed tables aligned on a fixed watershed order
+    -- the order is the sorted pfaf_id of data/Attributes.csv, a position is
+       the same watershed in every source
+    -- a source is placed once on the order, joining the sources is putting
+       their columns side by side instead of chained pd.merge on pfaf_id
+    -- risk baseline of the severity by watershed
+"""
+
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+import reference_data
+
+
+@functools.lru_cache(maxsize=1)
+def _order(version):
+    pfaf_id = reference_data.attributes()["pfaf_id"].to_numpy()
+    return pd.Index(np.unique(pfaf_id), name="pfaf_id")
+
+
+def watershed_order():
+    """pfaf_id of the watersheds in the fixed order"""
+    return _order(os.path.getmtime(reference_data.ATTRIBUTES_CSV))
+
+
+@functools.lru_cache(maxsize=1)
+def _risk_baseline(version):
+    join1 = reference_data.watershed_attributes()
+    risk = np.fmax(
+        join1["rfr_score"].to_numpy() * 20, join1["cfr_score"].to_numpy() * 20
+    )
+    with np.errstate(divide="ignore"):
+        return pd.Series(np.log(100 - risk), index=join1["pfaf_id"])
+
+
+def risk_baseline(pfaf_id):
+    """log(100 - max(scaled riverine risk, scaled coastal risk)) of the watersheds
+    -- NaN for a watershed without attributes
+    """
+    version = tuple(
+        os.path.getmtime(x)
+        for x in [reference_data.ATTRIBUTES_CSV, reference_data.RESILIENCE_CSV]
+    )
+    return _risk_baseline(version).reindex(pfaf_id).to_numpy()
+
+
+def _rows(index, frames, how):
+    """watersheds in the join, as a mask on index"""
+
+    present = None
+    for frame in frames:
+        mask = np.zeros(len(index), dtype=bool)
+        mask[index.get_indexer(frame.index)] = True
+        if present is None or how == "right":
+            present = mask
+        elif how == "outer":
+            present |= mask
+        elif how == "inner":
+            present &= mask
+
+    return present
+
+
+def join(frames, how="outer", suffixes=("_x", "_y")):
+    """join tables indexed by pfaf_id, as pd.merge(on="pfaf_id") from left to right
+    -- how: outer, inner, left (rows of the first table) or right (rows of the last)
+    -- the rows are in the watershed order, a pfaf_id missing from the order
+       is added to it
+    -- a column in two tables gets the suffixes, as in pd.merge
+    """
+
+    index = watershed_order()
+    for frame in frames:
+        if not frame.index.is_unique:
+            raise ValueError("duplicate pfaf_id in a joined table")
+        extra = frame.index.difference(index)
+        if len(extra):
+            index = index.union(extra)
+    rows = index[_rows(index, frames, how)]
+
+    columns = {}
+    for frame in frames:
+        aligned = frame.reindex(rows)
+        for name in aligned.columns:
+            if name in columns:
+                columns = {
+                    (f"{x}{suffixes[0]}" if x == name else x): values
+                    for x, values in columns.items()
+                }
+                columns[f"{name}{suffixes[1]}"] = aligned[name]
+            else:
+                columns[name] = aligned[name]
+
+    return pd.DataFrame(columns, index=rows)